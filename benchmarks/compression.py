@@ -0,0 +1,92 @@
+"""Compare websocket compression thresholds and levels.
+
+Replays what one client receives over an evening (a first history page, a
+roster snapshot, then a stream of chat messages and roster deltas) through
+the app's permessage-deflate extension for each threshold and level, and
+reports the bytes put on the uplink against the CPU spent compressing.
+
+    python benchmarks/compression.py --bears 100 --messages 500
+"""
+import argparse
+import importlib.util
+import os
+import random
+from types import SimpleNamespace
+
+from wsproto.frame_protocol import Opcode, RsvBits
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def frames(chat, bears, messages):
+    """Engine.IO text frames, as the websocket writer would send them"""
+    colors = list(chat.COLOR_CODES.values())
+    creatures = list(chat.FOREST_CREATURES)
+    words = ('acorn berry creek moss honey den pine fern owl hollow river stump '
+             'picnic tonight tomorrow maybe yes no sure lol see you by the old oak').split()
+    rng = random.Random(1)
+
+    def message(i):
+        content = ' '.join(rng.choice(words) for _ in range(rng.randint(2, 15)))
+        return {'id': i, 'sender': f'bear{i % 7}', 'content': content,
+                'timestamp': '2026-10-17T18:00:00.000000-04:00', 'private': False,
+                'color': colors[i % len(colors)], 'icon': chat.creature_icon_url(creatures[i % len(creatures)])}
+
+    def packet(event, data):
+        return chat.ForestPacket(data=[event, data]).encode().encode()
+
+    roster = [{'username': f'bear{i}', 'icon': chat.creature_icon_url(creatures[i % len(creatures)])}
+              for i in range(bears)]
+    yield packet('message_history', [message(i) for i in range(chat.HISTORY_PAGE_SIZE)])
+    yield packet('bear_update', {'version': 1, 'bears': roster, 'count': bears})
+    for i in range(messages):
+        yield packet('message', message(chat.HISTORY_PAGE_SIZE + i))
+        if i % 10 == 0:
+            yield packet('bear_delta', {'version': 2 + i, 'joined': roster[i % bears:i % bears + 1],
+                                        'left': [], 'count': bears})
+
+
+def run(chat, stream, threshold, level):
+    chat.COMPRESSION_THRESHOLD = threshold
+    chat.COMPRESSION_LEVEL = level
+    chat.compression_stats = chat.CompressionStats()
+    extension = chat.ThresholdDeflate()
+    extension.accept('permessage-deflate')
+    proto = SimpleNamespace(client=False)
+    sent = 0
+    for frame in stream:
+        _, data = extension.frame_outbound(proto, Opcode.TEXT, RsvBits(False, False, False), frame, True)
+        sent += len(data)
+    return sent, chat.compression_stats.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bears', type=int, default=100, help='roster size')
+    parser.add_argument('--messages', type=int, default=500, help='chat messages after connecting')
+    parser.add_argument('--thresholds', nargs='+', type=int, default=[0, 64, 256, 1024])
+    parser.add_argument('--levels', nargs='+', type=int, default=[1, 6, 9])
+    args = parser.parse_args()
+
+    chat = load_app()
+    stream = list(frames(chat, args.bears, args.messages))
+    raw = sum(len(frame) for frame in stream)
+    print(f'{len(stream)} frames, {raw} bytes uncompressed\n')
+    print(f'{"threshold":>9} {"level":>5} {"deflated":>8} {"bytes sent":>10} {"saved":>6} {"cpu ms":>8}')
+    for threshold in args.thresholds:
+        for level in args.levels:
+            sent, stats = run(chat, stream, threshold, level)
+            print(f'{threshold:9} {level:5} {stats["compressed_frames"]:8} {sent:10} '
+                  f'{(raw - sent) / raw:6.0%} {stats["cpu_seconds"] * 1000:8.2f}')
+
+
+if __name__ == '__main__':
+    main()
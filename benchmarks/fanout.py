@@ -0,0 +1,144 @@
+"""Benchmark encoding cost of chat fan-out at 1k and 10k listeners.
+
+Registers fake sockets with the app's Socket.IO server (packets are
+encoded the way the websocket writer would, then dropped) and measures:
+
+  * a public message broadcast, encoded per listener (the per-sid path
+    that emits with callbacks take) versus once for all of them
+  * the first history page sent on connect, re-encoded for every client
+    versus spliced from the encodings cached on buffered messages
+  * the roster snapshot sent on connect, rebuilt and encoded for every
+    client in a reconnect storm versus once per presence version
+
+    python benchmarks/fanout.py --listeners 1000 10000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class EncodeCounter:
+    """Wraps json.dumps to count encodes; event names count as one each,
+    spliced SharedPayloads not at all"""
+
+    def __init__(self):
+        self.calls = 0
+        self.original = json.dumps
+
+    def __enter__(self):
+        def counting_dumps(*args, **kwargs):
+            self.calls += 1
+            return self.original(*args, **kwargs)
+        json.dumps = counting_dumps
+        return self
+
+    def __exit__(self, *exc):
+        json.dumps = self.original
+
+
+def timed(label, func, rounds, per=1):
+    with EncodeCounter() as counter:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = (time.perf_counter() - start) / rounds
+    print(f'  {label:48} {elapsed * 1000:9.2f} ms/op  {elapsed / per * 1e6:8.2f} us/listener  '
+          f'{counter.calls / rounds:9.0f} json.dumps/op')
+
+
+def sample_message(chat, i):
+    return {'id': i, 'sender': f'bear{i % 50}', 'content': f'hello forest number {i}',
+            'timestamp': '2026-10-17T18:00:00.000000-04:00', 'private': False,
+            'color': chat.COLOR_CODES['moss'], 'icon': chat.creature_icon_url('bear')}
+
+
+def bench(chat, listeners, rounds, connect_count):
+    server = chat.socketio.server
+    manager = server.manager
+    sent = []
+
+    def send_eio_packet(eio_sid, pkt):
+        # What the websocket writer does with each queued packet
+        sent.append(pkt.encode())
+        if len(sent) > 10000:
+            sent.clear()
+
+    server._send_eio_packet = send_eio_packet
+    server._send_packet = lambda eio_sid, pkt: send_eio_packet(eio_sid, pkt)
+    sids = []
+    for i in range(listeners):
+        sid = manager.connect(f'eio{listeners}-{i}', '/')
+        sids.append(sid)
+        chat.connected_bears[sid] = {'username': f'bear{i}', 'icon': chat.creature_icon_url('bear')}
+
+    print(f'\n{listeners} listeners')
+    message = sample_message(chat, 1)
+
+    def per_listener():
+        for sid in sids:
+            chat.socketio.emit('message', dict(message), to=sid, namespace='/')
+
+    def broadcast():
+        chat.socketio.emit('message', chat.SharedPayload(message), namespace='/')
+
+    timed('message, encoded per listener', per_listener, max(1, rounds // 10), listeners)
+    timed('message, broadcast encoded once', broadcast, rounds, listeners)
+
+    page = [sample_message(chat, i) for i in range(chat.HISTORY_PAGE_SIZE)]
+    shared_page = [chat.SharedPayload(m) for m in page]
+    connects = min(listeners, connect_count)
+
+    def history_plain():
+        for sid in sids[:connects]:
+            chat.socketio.emit('message_history', [dict(m) for m in page], to=sid, namespace='/')
+
+    def history_shared():
+        for sid in sids[:connects]:
+            chat.socketio.emit('message_history', list(shared_page), to=sid, namespace='/')
+
+    timed(f'history page to {connects} connects, re-encoded', history_plain, 1, connects)
+    timed(f'history page to {connects} connects, spliced', history_shared, 1, connects)
+
+    def snapshot_per_connect():
+        for sid in sids[:connects]:
+            chat.socketio.emit('bear_update', dict(chat.presence_snapshot()), to=sid, namespace='/')
+
+    def snapshot_cached():
+        for sid in sids[:connects]:
+            chat.socketio.emit('bear_update', chat.presence_snapshots.get(), to=sid, namespace='/')
+
+    timed(f'roster to {connects} connects, built per connect', snapshot_per_connect, 1, connects)
+    timed(f'roster to {connects} connects, once per version', snapshot_cached, 1, connects)
+
+    for sid in sids:
+        chat.connected_bears.pop(sid, None)
+        manager.disconnect(sid, '/')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listeners', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--connects', type=int, default=1000,
+                        help='clients receiving the history page and roster')
+    args = parser.parse_args()
+
+    chat = load_app()
+    for listeners in args.listeners:
+        bench(chat, listeners, args.rounds, args.connects)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark rendering the landing page template.
+
+Compares the old approach (render_template_string on every hit, which parses
+and compiles the whole inline template, color and creature pickers included)
+with the template compiled once at import plus the pre-rendered pickers.
+
+    python benchmarks/index_template.py --rounds 500
+"""
+import argparse
+import importlib.util
+import os
+import time
+
+from flask import render_template, render_template_string
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(label, func, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(i)
+    elapsed = (time.perf_counter() - start) / rounds * 1e6
+    print(f'{label:40} {elapsed:10.1f} us/op')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    chat = load_app()
+    user = {'id': 1, 'username': 'bear0', 'session_id': 'x',
+            'color_name': 'moss', 'icon_name': 'bear'}
+
+    # The page as it was before the pickers were split out
+    inline_source = (chat.HTML_TEMPLATE
+                     .replace('{{ color_picker }}', chat.COLOR_PICKER_TEMPLATE)
+                     .replace('{{ creature_picker }}', chat.CREATURE_PICKER_TEMPLATE))
+
+    def render_string(i):
+        return render_template_string(
+            inline_source, current_user=user, selected=user['color_name'],
+            assets=chat.PAGE_ASSETS,
+            history_page_size=chat.HISTORY_PAGE_SIZE,
+            upload_chunk_size=chat.UPLOAD_CHUNK_SIZE,
+            wire_schema=chat.WIRE_SCHEMA,
+            creature_icon_url=chat.creature_icon_url,
+            FOREST_COLORS=chat.FOREST_COLORS,
+            FOREST_CREATURES=chat.FOREST_CREATURES)
+
+    def render_compiled(i):
+        return render_template(
+            chat.INDEX_TEMPLATE, current_user=user,
+            assets=chat.PAGE_ASSETS,
+            history_page_size=chat.HISTORY_PAGE_SIZE,
+            upload_chunk_size=chat.UPLOAD_CHUNK_SIZE,
+            wire_schema=chat.WIRE_SCHEMA,
+            color_picker=chat.COLOR_PICKERS[user['color_name']],
+            creature_picker=chat.CREATURE_PICKERS[user['icon_name']])
+
+    with chat.app.test_request_context('/'):
+        timed('render_template_string (parse each hit)', render_string, args.rounds)
+        timed('compiled template + pre-rendered pickers', render_compiled, args.rounds)
+
+    client = chat.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user'] = user
+    timed('GET / (logged in, full request)', lambda i: client.get('/'), args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark private-message routing with many simulated connections.
+
+Compares the old approach (scan every entry of connected_bears and emit to
+each matching socket id) with the username index in LocalBearRegistry and
+per-user Socket.IO rooms. Socket writes are replaced with a no-op, so the
+numbers are routing and encoding cost only.
+
+    python benchmarks/private_routing.py --connections 10000
+"""
+import argparse
+import importlib.util
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(label, func, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(i)
+    elapsed = (time.perf_counter() - start) / rounds * 1e6
+    print(f'{label:40} {elapsed:10.1f} us/op')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=10_000)
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    chat = load_app()
+    server = chat.socketio.server
+    sent = [0]
+    server._send_eio_packet = lambda *packet_args: sent.__setitem__(0, sent[0] + 1)
+
+    # Simulate one socket per user, registered the way handle_connect does it
+    registry = chat.LocalBearRegistry()
+    usernames = [f'bear{i}' for i in range(args.connections)]
+    for i, username in enumerate(usernames):
+        sid = server.manager.connect(f'eio{i}', '/')
+        registry[sid] = {'username': username, 'icon': '/media/forest_creatures/bear.png'}
+        server.enter_room(sid, chat.user_room(username), namespace='/')
+
+    message = {'id': 1, 'sender': 'bear0', 'content': 'psst', 'private': True,
+               'timestamp': '2026-01-01T12:00:00', 'color': '#8FBC6B',
+               'icon': '/media/forest_creatures/bear.png'}
+
+    # The scans walk the plain dict directly, as the old module-level
+    # connected_bears dict did
+    def pick(i):
+        return usernames[(i * 7919) % len(usernames)]
+
+    print(f'{args.connections} connections\n')
+
+    def scan_lookup(i):
+        recipient = pick(i)
+        return [sid for sid, bear in registry.bears.items() if bear['username'] == recipient]
+    timed('lookup: linear scan of connected_bears', scan_lookup, args.rounds)
+    timed('lookup: username index (sids_for)', lambda i: registry.sids_for(pick(i)), args.rounds)
+
+    def scan_deliver(i):
+        recipient = pick(i)
+        for sid, bear in registry.bears.items():
+            if bear['username'] in (recipient, 'bear0'):
+                server.emit('message', message, to=sid, namespace='/')
+    timed('deliver: scan + emit per socket', scan_deliver, args.rounds)
+
+    def room_deliver(i):
+        server.emit('message', message,
+                    to=[chat.user_room(pick(i)), chat.user_room('bear0')], namespace='/')
+    timed('deliver: per-user rooms', room_deliver, args.rounds)
+
+    def evict(i):
+        username = pick(i)
+        for sid in registry.sids_for(username):
+            bear = registry.pop(sid)
+            registry[sid] = bear
+    timed('evict: index lookup + pop', evict, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Compare SQLite query plans for the chat's hot queries with and without
+the indexes added in migrations/versions/3f1c2a9b7d10_add_hot_column_indexes.py
+and migrations/versions/b3d9a6e2f471_add_private_message_indexes.py.
+
+Builds a synthetic chat database (2 million messages by default), then runs
+EXPLAIN QUERY PLAN and times each query before and after creating the indexes.
+
+    python benchmarks/query_plans.py --messages 2000000 --db bench_chat.db
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+# Mirrors the tables db.create_all() builds from the models, minus the
+# secondary indexes under test. Timestamps are integer UTC epoch
+# milliseconds, as EpochMillis stores them.
+SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY,
+    username VARCHAR(80) NOT NULL UNIQUE,
+    password_hash VARCHAR(120) NOT NULL,
+    color_name VARCHAR(30),
+    icon_name VARCHAR(30),
+    active_session VARCHAR(100),
+    last_seen BIGINT
+);
+CREATE TABLE session (
+    id INTEGER PRIMARY KEY,
+    session_id VARCHAR(100) NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL REFERENCES user (id),
+    created_at BIGINT,
+    last_active BIGINT,
+    socket_id VARCHAR(100)
+);
+CREATE TABLE message (
+    id INTEGER PRIMARY KEY,
+    content VARCHAR(500) NOT NULL,
+    timestamp BIGINT,
+    username VARCHAR(80) NOT NULL,
+    is_private BOOLEAN,
+    recipient VARCHAR(80),
+    color_name VARCHAR(30),
+    sender_id INTEGER REFERENCES user (id)
+);
+CREATE TABLE file_attachment (
+    id INTEGER PRIMARY KEY,
+    filename VARCHAR(255) NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    mime_type VARCHAR(127) NOT NULL,
+    file_size INTEGER NOT NULL,
+    upload_date BIGINT,
+    message_id INTEGER REFERENCES message (id),
+    uploader_id INTEGER REFERENCES user (id),
+    content_hash VARCHAR(64),
+    thumbnail_filename VARCHAR(255)
+);
+'''
+
+
+def epoch_ms(*args):
+    """A UTC wall-clock time as stored epoch milliseconds"""
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+INDEXES = [
+    'CREATE INDEX ix_message_timestamp_id ON message (timestamp, id)',
+    'CREATE INDEX ix_session_user_id_session_id ON session (user_id, session_id)',
+    'CREATE INDEX ix_session_last_active ON session (last_active)',
+    'CREATE INDEX ix_file_attachment_message_id ON file_attachment (message_id)',
+    'CREATE INDEX ix_message_recipient_timestamp ON message (recipient, timestamp)',
+    'CREATE INDEX ix_message_sender_id_timestamp ON message (sender_id, timestamp)',
+]
+
+QUERIES = {
+    'history page': (
+        'SELECT * FROM message WHERE is_private IS NOT 1 '
+        'ORDER BY timestamp DESC, id DESC LIMIT 50', ()),
+    'older history page': (
+        'SELECT * FROM message WHERE is_private IS NOT 1 AND (timestamp, id) < (?, ?) '
+        'ORDER BY timestamp DESC, id DESC LIMIT 50',
+        (epoch_ms(2025, 1, 5, 12), 10**9)),
+    "user's private messages": (
+        'SELECT * FROM message WHERE is_private = 1 AND (recipient = ? OR sender_id = ?) '
+        'ORDER BY timestamp DESC, id DESC LIMIT 50', ('user42', 42)),
+    'conversation page': (
+        'SELECT * FROM message WHERE is_private = 1 AND '
+        '((sender_id = ? AND recipient = ?) OR (recipient = ? AND username = ?)) '
+        'ORDER BY timestamp DESC, id DESC LIMIT 50', (42, 'user7', 'user42', 'user7')),
+    'sessions for login': (
+        'SELECT * FROM session WHERE user_id = ?', (42,)),
+    'session by user': (
+        'SELECT * FROM session WHERE user_id = ? AND session_id = ?', (42, 'sess-42')),
+    'stale sessions': (
+        'SELECT * FROM session WHERE last_active < ?', (epoch_ms(2025, 1, 2),)),
+    'attachments for page': (
+        'SELECT * FROM file_attachment WHERE message_id IN (%s)' % ','.join('?' * 50),
+        tuple(range(1000, 1050))),
+}
+
+
+def populate(con, messages, users, sessions, attachments):
+    con.executescript(SCHEMA)
+    start = epoch_ms(2025, 1, 1)
+    con.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+        "INSERT INTO user (id, username, password_hash, color_name, icon_name) "
+        "SELECT i, 'user' || i, 'x', 'moss', 'owl' FROM n", (users,))
+    con.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+        "INSERT INTO message (id, content, timestamp, username, is_private, recipient, sender_id) "
+        "SELECT i, 'hello forest ' || i, ? + i * 7000, "
+        "'user' || (i % ? + 1), i % 20 = 0, "
+        "CASE WHEN i % 20 = 0 THEN 'user' || ((i / 20) % ? + 1) END, "
+        "i % ? + 1 FROM n", (messages, start, users, users, users))
+    con.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+        "INSERT INTO session (id, session_id, user_id, created_at, last_active) "
+        "SELECT i, 'sess-' || i, i % ? + 1, ? + i * 60000, ? + i * 60000 FROM n",
+        (sessions, users, start, start))
+    con.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+        "INSERT INTO file_attachment (id, filename, original_filename, mime_type, file_size, message_id) "
+        "SELECT i, 'f' || i || '.png', 'f.png', 'image/png', 1024, (i * 19) % ? + 1 FROM n",
+        (attachments, messages))
+    con.commit()
+
+
+def report(con, label):
+    print(f'== {label}')
+    for name, (sql, params) in QUERIES.items():
+        plan = [row[3] for row in con.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        start = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f'{name:24} {elapsed:9.2f} ms  {"; ".join(plan)}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench_chat.db')
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--sessions', type=int, default=200_000)
+    parser.add_argument('--attachments', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    con = sqlite3.connect(args.db)
+
+    start = time.perf_counter()
+    populate(con, args.messages, args.users, args.sessions, args.attachments)
+    print(f'Built {args.db} with {args.messages} messages in {time.perf_counter() - start:.1f}s\n')
+
+    report(con, 'without indexes')
+    for ddl in INDEXES:
+        con.execute(ddl)
+    con.execute('ANALYZE')
+    report(con, 'with indexes')
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
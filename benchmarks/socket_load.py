@@ -0,0 +1,259 @@
+"""Load test the Socket.IO server under each async mode.
+
+Starts serve.py in a subprocess per mode against a throwaway database, logs
+in a batch of users, then ramps up concurrent websocket connections level by
+level. At every level one user sends timestamped public messages and every
+connected client records how long each took to arrive, giving p50/p99
+broadcast latency; the ramp stops at the first level where clients fail to
+connect, which bounds the sockets one process can hold.
+
+Clients speak raw Engine.IO v4 over simple-websocket (already installed
+with Flask-SocketIO), so the benchmark needs no extra packages. Modes whose
+library is not installed are skipped.
+
+    python benchmarks/socket_load.py --modes threading eventlet gevent --levels 100 500 1000
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import simple_websocket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench'
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_users(count):
+    """Insert bench users straight into the database named by FOREST_DATABASE_URL"""
+    from werkzeug.security import generate_password_hash
+
+    chat = load_app()
+    # One hash iteration: the benchmark measures sockets, not logins
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1')
+    with chat.app.app_context():
+        chat.db.create_all()
+        chat.db.session.execute(chat.User.__table__.insert(), [
+            {'username': f'bench{i}', 'password_hash': password_hash,
+             'color_name': 'moss', 'icon_name': 'bear'}
+            for i in range(count)])
+        chat.db.session.commit()
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if port_in_use(port):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def login(port, username):
+    """Session cookie for username"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('POST', '/login', body=f'username={username}&password={PASSWORD}',
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = response.getheader('Set-Cookie')
+    return cookie.split(';', 1)[0] if cookie else None
+
+
+class WebSocket(simple_websocket.Client):
+    """simple-websocket client that keeps frames sent with the handshake.
+
+    Client.handshake() stops reading wsproto events at AcceptConnection, so
+    an Engine.IO open packet that arrives in the same read stays queued
+    until more bytes come in (the first ping, 25 s later) and the
+    connection looks stalled. Deliver those frames straight away.
+    """
+
+    def handshake(self):
+        super().handshake()
+        self.connected = self._handle_events()
+
+
+class BenchClient:
+    """One Socket.IO connection that records message latencies"""
+
+    def __init__(self, port, cookie, latencies, lock):
+        self.latencies = latencies
+        self.lock = lock
+        self.ws = WebSocket(
+            f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket',
+            headers={'Cookie': cookie})
+        # Engine.IO open packet, then the Socket.IO namespace connect
+        if not self.ws.receive(timeout=30).startswith('0'):
+            raise ConnectionError('no Engine.IO handshake')
+        self.ws.send('40')
+        # Events emitted by the connect handler can arrive before its ack
+        while True:
+            packet = self.ws.receive(timeout=30)
+            if packet is None or packet.startswith('44'):
+                raise ConnectionError('namespace connect refused')
+            if packet.startswith('40'):
+                break
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        try:
+            while True:
+                packet = self.ws.receive()
+                if packet is None:
+                    return
+                if packet == '2':
+                    self.ws.send('3')
+                elif packet.startswith('42["message"'):
+                    content = json.loads(packet[2:])[1]['content']
+                    if content.startswith('bench '):
+                        elapsed = time.perf_counter() - float(content.split()[1])
+                        with self.lock:
+                            self.latencies.append(elapsed)
+        except simple_websocket.ConnectionClosed:
+            pass
+
+    def send_message(self, content):
+        self.ws.send('42' + json.dumps(['message', {'content': content}]))
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_level(port, clients, cookies, target, latencies, lock, messages, interval):
+    """Grow clients to target connections, then time a burst of broadcasts"""
+    start = time.perf_counter()
+    while len(clients) < target:
+        try:
+            clients.append(BenchClient(port, cookies[len(clients)], latencies, lock))
+        except Exception as e:
+            return {'connected': len(clients), 'error': str(e) or type(e).__name__}
+    connect_seconds = time.perf_counter() - start
+
+    # Let the roster broadcasts from the ramp settle
+    time.sleep(1)
+    with lock:
+        latencies.clear()
+    try:
+        for _ in range(messages):
+            clients[0].send_message(f'bench {time.perf_counter()}')
+            time.sleep(interval)
+    except simple_websocket.ConnectionClosed as e:
+        # The server dropped the sender: a failed level, like a refused connect
+        return {'connected': len(clients), 'error': str(e) or type(e).__name__}
+
+    expected = messages * len(clients)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        with lock:
+            if len(latencies) >= expected:
+                break
+        time.sleep(0.1)
+    with lock:
+        received = list(latencies)
+    result = {'connected': len(clients), 'connect_seconds': connect_seconds,
+              'delivered': len(received), 'expected': expected}
+    if received:
+        result['p50_ms'] = statistics.median(received) * 1000
+        result['p99_ms'] = percentile(received, 0.99) * 1000
+    return result
+
+
+def port_in_use(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def bench_mode(mode, levels, port, messages, interval):
+    if port_in_use(port):
+        sys.exit(f'port {port} is already in use (a server left from an interrupted run?)')
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, FOREST_DATABASE_URL=f'sqlite:///{os.path.join(tmp, "bench.db")}')
+        os.environ['FOREST_DATABASE_URL'] = env['FOREST_DATABASE_URL']
+        create_users(max(levels))
+
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'serve.py'), '--mode', mode,
+             '--host', '127.0.0.1', '--port', str(port)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        clients, latencies, lock = [], [], threading.Lock()
+        results = []
+        try:
+            if not wait_for_port(port):
+                print(f'{mode}: server did not start')
+                return results
+            cookies = [login(port, f'bench{i}') for i in range(max(levels))]
+            for level in levels:
+                result = run_level(port, clients, cookies, level, latencies, lock, messages, interval)
+                results.append((level, result))
+                report(mode, level, result)
+                if 'error' in result:
+                    break
+        finally:
+            for client in clients:
+                client.close()
+            server.terminate()
+            server.wait(timeout=10)
+        return results
+
+
+def report(mode, level, result):
+    if 'error' in result:
+        print(f'{mode:10} {level:>7} sockets  failed after {result["connected"]}: {result["error"]}')
+        return
+    latency = (f'p50 {result["p50_ms"]:8.1f} ms  p99 {result["p99_ms"]:8.1f} ms'
+               if 'p50_ms' in result else 'no deliveries')
+    print(f'{mode:10} {level:>7} sockets  connect {result["connect_seconds"]:6.1f} s  '
+          f'{latency}  delivered {result["delivered"]}/{result["expected"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['threading', 'eventlet', 'gevent'])
+    parser.add_argument('--levels', nargs='+', type=int, default=[50, 100, 250, 500, 1000])
+    parser.add_argument('--messages', type=int, default=20, help='broadcasts timed per level')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between broadcasts')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    # Each client holds a reader thread; keep their stacks small
+    threading.stack_size(256 * 1024)
+    levels = sorted(args.levels)
+    for mode in args.modes:
+        if mode != 'threading' and importlib.util.find_spec(mode) is None:
+            print(f'{mode:10} skipped (pip install {mode})')
+            continue
+        bench_mode(mode, levels, args.port, args.messages, args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare the JSON and compact MessagePack wire formats.
+
+Encodes a first history page and a roster snapshot with the app's packet
+classes for each format, and reports the frame size and how long the
+client-side decode takes (Python's json and msgpack standing in for the
+browser parsers).
+
+    python benchmarks/wire_format.py --bears 100 --rounds 2000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+import msgpack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bears', type=int, default=100, help='roster size')
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    chat = load_app()
+    colors = list(chat.COLOR_CODES)
+    creatures = list(chat.FOREST_CREATURES)
+    page = [{'id': i, 'sender': f'bear{i % 7}', 'content': f'see you by the old oak at {i % 12} o\'clock',
+             'timestamp': '2026-10-17T18:00:00.000000-04:00', 'private': False,
+             'color': chat.COLOR_CODES[colors[i % len(colors)]],
+             'icon': chat.creature_icon_url(creatures[i % len(creatures)])}
+            for i in range(chat.HISTORY_PAGE_SIZE)]
+    bears = [{'username': f'bear{i}', 'icon': chat.creature_icon_url(creatures[i % len(creatures)])}
+             for i in range(args.bears)]
+    events = {
+        'message_history': page,
+        'bear_update': {'version': 1, 'bears': bears, 'count': len(bears)},
+    }
+
+    compact_packet = chat.compact_packet_class()
+    print(f'{"event":16} {"format":8} {"bytes":>8} {"decode us":>10}')
+    for event, data in events.items():
+        frame = chat.ForestPacket(data=[event, data]).encode()
+        print(f'{event:16} {"json":8} {len(frame.encode()):8} '
+              f'{timed(lambda: json.loads(frame[1:]), args.rounds):10.1f}')
+        frame = compact_packet(data=[event, data]).encode()
+        print(f'{event:16} {"msgpack":8} {len(frame):8} '
+              f'{timed(lambda: msgpack.unpackb(frame), args.rounds):10.1f}')
+
+
+if __name__ == '__main__':
+    main()
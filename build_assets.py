@@ -0,0 +1,189 @@
+"""Build the front-end bundles served from /assets.
+
+Concatenates the vendored socket.io client with static/src/forest.js (once
+per wire format: forest.js for JSON, forest.msgpack.js for MessagePack),
+and a Tailwind build with static/src/forest.css, then writes each asset
+under a content-hashed name with .gz (and .br, if the brotli package is
+installed) twins next to it, plus manifest.json for the app to pick up on
+restart.
+
+Third-party files are downloaded into static/vendor on the first build;
+copy that folder along with the app for hosts without internet access.
+If the tailwindcss CLI (v3 or v4) is on PATH (or given with --tailwind),
+Tailwind is built from only the classes the app uses, and the build stops
+if the CLI fails; without a CLI the full stylesheet is bundled.
+
+    python build_assets.py [--offline] [--tailwind PATH]
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+spec = importlib.util.spec_from_file_location(
+    'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+chat = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat)
+
+VENDOR_FOLDER = os.path.join(ROOT, 'static', 'vendor')
+VENDOR_FILES = {
+    'socket.io.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.min.js',
+    'socket.io.msgpack.min.js': 'https://cdn.socket.io/4.0.1/socket.io.msgpack.min.js',
+    'tailwind.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/tailwindcss/2.2.19/tailwind.min.css',
+}
+# Files the Tailwind CLI scans for class names
+TAILWIND_CONTENT = ['forest-friends-chat.py', 'static/src/forest.js']
+COMPRESSIBLE = ('.js', '.css')
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def vendor(name, offline):
+    """Path of a vendored third-party file, downloading it if needed"""
+    path = os.path.join(VENDOR_FOLDER, name)
+    if not os.path.exists(path):
+        if offline:
+            sys.exit(f"{path} is missing; run once with network access or copy static/vendor over")
+        os.makedirs(VENDOR_FOLDER, exist_ok=True)
+        print(f"  downloading {VENDOR_FILES[name]}")
+        with urllib.request.urlopen(VENDOR_FILES[name], timeout=30) as response:
+            data = response.read()
+        with open(path, 'wb') as f:
+            f.write(data)
+    return path
+
+
+def tailwind_major_version(cli):
+    """Major version of the tailwindcss CLI, from the banner of --help"""
+    try:
+        result = subprocess.run([cli, '--help'], capture_output=True, text=True, timeout=60)
+    except OSError as e:
+        sys.exit(f"could not run the tailwindcss CLI at {cli}: {e}")
+    match = re.search(r'tailwindcss v(\d+)\.', result.stdout + result.stderr)
+    if not match:
+        sys.exit(f"could not tell which version the tailwindcss CLI at {cli} is")
+    return int(match.group(1))
+
+
+def tailwind_input(major):
+    """Input stylesheet naming the files to scan, in the CLI version's syntax"""
+    if major == 3:
+        return '@tailwind base;\n@tailwind components;\n@tailwind utilities;\n', [
+            '--content', ','.join(os.path.join(ROOT, p) for p in TAILWIND_CONTENT)]
+    if major == 4:
+        # v4 dropped --content; sources are listed in the stylesheet instead
+        sources = ''.join(f'@source "{os.path.join(ROOT, p).replace(os.sep, "/")}";\n'
+                          for p in TAILWIND_CONTENT)
+        return '@import "tailwindcss" source(none);\n' + sources, []
+    sys.exit(f"tailwindcss CLI v{major} is not supported; use v3 or v4")
+
+
+def build_tailwind(cli, offline):
+    """Tailwind CSS purged to the classes in use, or the full vendored build"""
+    if cli is None:
+        print("  tailwindcss CLI not found, bundling the full stylesheet")
+        return read(vendor('tailwind.min.css', offline))
+
+    major = tailwind_major_version(cli)
+    stylesheet, options = tailwind_input(major)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.css')
+        output = os.path.join(tmp, 'output.css')
+        with open(source, 'w') as f:
+            f.write(stylesheet)
+        result = subprocess.run([cli, '-i', source, '-o', output, '--minify', *options],
+                                capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.exists(output) or not os.path.getsize(output):
+            sys.exit(f"tailwindcss v{major} failed (exit {result.returncode}):\n{result.stderr.strip()}")
+        print(f"  built Tailwind with the v{major} CLI")
+        return read(output)
+
+
+def write_asset(output_folder, name, data):
+    """Write data under a fingerprinted name, with precompressed twins"""
+    stem, extension = os.path.splitext(name)
+    built_name = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+    path = os.path.join(output_folder, built_name)
+    written = [built_name]
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    if extension in COMPRESSIBLE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        written.append(built_name + '.gz')
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+            written.append(built_name + '.br')
+
+    for filename in written:
+        print(f"  {filename:40} {os.path.getsize(os.path.join(output_folder, filename)):>10,} bytes")
+    return built_name, written
+
+
+def build(offline, tailwind):
+    output_folder = os.path.join(ROOT, chat.ASSET_FOLDER)
+    os.makedirs(output_folder, exist_ok=True)
+    sources = {name: read(os.path.join(ROOT, path)) for name, path in chat.ASSET_SOURCES.items()}
+
+    bundles = dict(sources)
+    bundles['forest.js'] = read(vendor('socket.io.min.js', offline)) + b'\n;\n' + sources['forest.js']
+    # Same page script with the socket.io build for FOREST_WIRE_FORMAT=msgpack
+    if offline and not os.path.exists(os.path.join(VENDOR_FOLDER, 'socket.io.msgpack.min.js')):
+        print("  socket.io.msgpack.min.js not vendored, skipping forest.msgpack.js")
+    else:
+        bundles['forest.msgpack.js'] = (read(vendor('socket.io.msgpack.min.js', offline))
+                                        + b'\n;\n' + sources['forest.js'])
+    bundles['forest.css'] = build_tailwind(tailwind, offline) + b'\n' + sources['forest.css']
+
+    manifest, keep = {}, {'manifest.json'}
+    for name, data in bundles.items():
+        manifest[name], written = write_asset(output_folder, name, data)
+        keep.update(written)
+
+    # Write the manifest last so a running build never points at missing files
+    temp_path = os.path.join(output_folder, 'manifest.json.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, os.path.join(output_folder, 'manifest.json'))
+
+    for filename in os.listdir(output_folder):
+        if filename not in keep:
+            os.remove(os.path.join(output_folder, filename))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed front-end bundles')
+    parser.add_argument('--offline', action='store_true', help='fail instead of downloading missing vendor files')
+    parser.add_argument('--tailwind', default=shutil.which('tailwindcss'),
+                        help='path to the tailwindcss CLI (default: search PATH)')
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("  brotli not installed, writing .gz only")
+    manifest = build(args.offline, args.tailwind)
+    print(f"\nWrote {len(manifest)} assets to {chat.ASSET_FOLDER}; restart the app to serve them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -30,12 +30,13 @@ class ForestChatClient:
         
         # Initialize variables
         self.username = None
+        self.roster = {}
+        self.presence_version = None
+        self.seen_message_ids = set()
+        self.newest_message_id = None
         self.session = requests.Session()
-        self.sio = socketio.Client(
-            reconnection=True,
-            reconnection_attempts=5,
-            reconnection_delay=1
-        )
+        self.sio = None
+        self.serializer = None
         
         # Create UI elements
         self.main_container = None
@@ -52,8 +53,8 @@ class ForestChatClient:
         # Set up the UI
         self.create_ui()
         
-        # Set up socket events
-        self.setup_socket_events()
+        # Set up the socket and its events
+        self.create_socket('default')
         
         # Handle window closing
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -193,11 +194,27 @@ class ForestChatClient:
         )
         send_btn.pack(side=tk.LEFT)
     
+    def create_socket(self, serializer):
+        # 'msgpack' needs `pip install msgpack`; the server decides which
+        self.serializer = serializer
+        self.sio = socketio.Client(
+            reconnection=True,
+            reconnection_attempts=5,
+            reconnection_delay=1,
+            serializer=serializer
+        )
+        self.setup_socket_events()
+    
     def setup_socket_events(self):
         @self.sio.on('connect')
         def on_connect():
             print("Connected to server")
-            self.sio.emit('request_history')
+            self.presence_version = None
+            # After a reconnect, only ask for what was missed
+            if self.newest_message_id is None:
+                self.sio.emit('request_history')
+            else:
+                self.sio.emit('request_history', {'since_id': self.newest_message_id})
         
         @self.sio.on('message')
         def on_message(data):
@@ -205,15 +222,34 @@ class ForestChatClient:
         
         @self.sio.on('message_history')
         def on_history(messages):
+            # A full page replaces what is shown; it arrives newest first
+            self.seen_message_ids = set()
+            self.newest_message_id = None
             self.messages_area.config(state=tk.NORMAL)
             self.messages_area.delete(1.0, tk.END)
-            for message in messages:
+            for message in reversed(messages):
                 self.display_message(message)
             self.messages_area.config(state=tk.DISABLED)
         
+        @self.sio.on('missed_messages')
+        def on_missed_messages(messages):
+            for message in messages:
+                self.display_message(message)
+        
         @self.sio.on('bear_update')
         def on_bear_update(data):
-            self.update_users_list(data['bears'])
+            self.roster = {bear['username']: bear for bear in data['bears']}
+            self.presence_version = data.get('version')
+            self.update_users_list(list(self.roster.values()))
+        
+        @self.sio.on('bear_delta')
+        def on_bear_delta(data):
+            def change():
+                for username in data['left']:
+                    self.roster.pop(username, None)
+                for bear in data['joined']:
+                    self.roster[bear['username']] = bear
+            self.apply_presence_delta(data, change)
         
         @self.sio.on('system')
         def on_system(data):
@@ -223,6 +259,18 @@ class ForestChatClient:
             else:
                 self.display_system_message(data['message'])
     
+    def apply_presence_delta(self, data, change):
+        if self.presence_version is None or data['version'] <= self.presence_version:
+            return
+        if data['version'] != self.presence_version + 1:
+            # Missed a delta: ask for the full roster again
+            self.presence_version = None
+            self.sio.emit('request_presence_snapshot')
+            return
+        change()
+        self.presence_version = data['version']
+        self.update_users_list(list(self.roster.values()))
+    
     def handle_login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
@@ -245,6 +293,14 @@ class ForestChatClient:
     
     def connect_socket(self):
         try:
+            # Match the server's wire format. This client shows neither
+            # colors nor icons, so their compact ids are left unresolved.
+            response = self.session.get(f'{SERVER_URL}/wire_schema')
+            wire_format = response.json().get('format') if response.ok else 'json'
+            serializer = 'msgpack' if wire_format == 'msgpack' else 'default'
+            if serializer != self.serializer:
+                self.create_socket(serializer)
+            
             cookies = '; '.join([f'{k}={v}' for k, v in self.session.cookies.items()])
             self.sio.connect(
                 SERVER_URL,
@@ -271,6 +327,13 @@ class ForestChatClient:
                 messagebox.showerror("Error", "Failed to send message")
     
     def display_message(self, data):
+        # A message can arrive live and again in a reconnect replay
+        if data['id'] in self.seen_message_ids:
+            return
+        self.seen_message_ids.add(data['id'])
+        if self.newest_message_id is None or data['id'] > self.newest_message_id:
+            self.newest_message_id = data['id']
+        
         self.messages_area.config(state=tk.NORMAL)
         timestamp = datetime.fromisoformat(data['timestamp']).strftime('%H:%M:%S')
         prefix = "(Private) " if data.get('private') else ""
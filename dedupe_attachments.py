@@ -0,0 +1,131 @@
+"""Move existing attachments into the content-addressed store.
+
+Every FileAttachment without a content_hash is hashed; the first copy of
+each distinct file is stored as <sha256>.<ext>, later byte-identical
+copies are deleted, and all rows are pointed at the shared file with the
+blob's reference count updated. Safe to re-run: rows that already have a
+content_hash are skipped.
+
+Nothing a row still points at is removed before that row's new filename
+is committed: the stored copy is made as a hard link (or a copy) next to
+the original, and originals are only deleted once their batch has
+committed. A crash or failed commit leaves every row pointing at an
+existing file, and the next run picks the batch up again.
+
+    python dedupe_attachments.py [--dry-run] [--batch-size 200]
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+
+spec = importlib.util.spec_from_file_location(
+    'forest_friends_chat',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forest-friends-chat.py'))
+chat = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat)
+
+app, db = chat.app, chat.db
+ContentBlob, FileAttachment = chat.ContentBlob, chat.FileAttachment
+
+
+def link_into_store(path, filename):
+    """Give the file at path its content-addressed name too, leaving path in place"""
+    target = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(target):
+        # Only ever moved into place whole, so an interrupted run's target
+        # already holds this content
+        return
+    temp = target + '.dedupe'
+    if os.path.exists(temp):
+        os.remove(temp)
+    try:
+        os.link(path, temp)
+    except OSError:
+        shutil.copy2(path, temp)
+    os.replace(temp, target)
+
+
+def dedupe(batch_size, dry_run):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    last_id = 0
+    stats = {'rows': 0, 'duplicates': 0, 'missing': 0, 'bytes_reclaimed': 0}
+    seen = set()
+
+    while True:
+        batch = (FileAttachment.query
+                 .filter(FileAttachment.id > last_id, FileAttachment.content_hash.is_(None))
+                 .order_by(FileAttachment.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+
+        # Old names of this batch's files, removed once the batch commits
+        superseded = []
+        for attachment in batch:
+            last_id = attachment.id
+            path = os.path.join(upload_folder, attachment.filename)
+            if not os.path.exists(path):
+                print(f"  missing file for attachment {attachment.id}: {attachment.filename}")
+                stats['missing'] += 1
+                continue
+
+            digest = chat.hash_file(path)
+            stats['rows'] += 1
+            blob = db.session.get(ContentBlob, digest)
+            already_stored = blob is not None and blob.filename == attachment.filename
+            if (blob is not None or digest in seen) and not already_stored:
+                stats['duplicates'] += 1
+                stats['bytes_reclaimed'] += os.path.getsize(path)
+            seen.add(digest)
+
+            if dry_run:
+                continue
+
+            if blob is None:
+                extension = chat.file_extension(attachment.filename)
+                blob = ContentBlob(sha256=digest, filename=f'{digest}.{extension}' if extension else digest,
+                                   file_size=os.path.getsize(path), ref_count=1)
+                link_into_store(path, blob.filename)
+                db.session.add(blob)
+            else:
+                blob.ref_count = ContentBlob.ref_count + 1
+            db.session.flush()
+            if blob.filename != attachment.filename:
+                superseded.append(path)
+            attachment.filename = blob.filename
+            attachment.file_size = blob.file_size
+            attachment.content_hash = blob.sha256
+
+        if not dry_run:
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            for path in superseded:
+                if os.path.exists(path):
+                    os.remove(path)
+        print(f"  processed attachments up to id {last_id}")
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicate media/attachments into the content-addressed store')
+    parser.add_argument('--dry-run', action='store_true', help='report duplicates without changing anything')
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        stats = dedupe(args.batch_size, args.dry_run)
+
+    verb = 'would reclaim' if args.dry_run else 'reclaimed'
+    print(f"Hashed {stats['rows']} attachments, {stats['duplicates']} duplicates, "
+          f"{stats['missing']} missing files; {verb} {stats['bytes_reclaimed']} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,109 @@
 # forest_friends_chat.py
 
-from flask import Flask, render_template_string, request, session, redirect, url_for, send_from_directory, flash
-from flask_socketio import SocketIO, emit, disconnect
+from flask import Flask, render_template, request, session, redirect, url_for, send_from_directory, flash, abort, has_app_context
+from markupsafe import Markup
+from flask_socketio import SocketIO, emit, disconnect, join_room, leave_room
+from socketio.packet import Packet as SocketIOPacket
+from engineio import json as engineio_json
+import simple_websocket.ws
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import Opcode as WebSocketOpcode
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import event, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from apscheduler.schedulers.background import BackgroundScheduler
 import os
-from datetime import datetime, timedelta
+import json
+import threading
+import queue
+import time
+import atexit
+import signal
+import sys
+from collections import deque
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta, timezone
 import mimetypes
+import hashlib
+import importlib.util
+import zlib
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
 import pytz
 
-def eastern_now():
-    """Return the current time in Eastern Time Zone"""
-    eastern = pytz.timezone('America/New_York')
-    return datetime.now(eastern)
+try:
+    from PIL import Image
+except ImportError:  # thumbnails for images are skipped without Pillow
+    Image = None
+
+# Times are stored in UTC and only converted to the forest's zone when shown
+LOCAL_TIMEZONE = pytz.timezone('America/New_York')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def utc_now():
+    """Return the current UTC time, at the millisecond precision it is stored with"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def local_time(value):
+    """Return an aware datetime in the forest's local zone, for display"""
+    return value.astimezone(LOCAL_TIMEZONE)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///chat.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FOREST_DATABASE_URL', 'sqlite:///chat.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# SQLite tuning profiles, selected with the FOREST_DB_PROFILE environment variable.
+# 'production' switches to WAL so history reads are not blocked by message
+# commits, and sizes the pool for many concurrent socket handlers.
+SQLITE_PROFILES = {
+    'development': {
+        'pragmas': {
+            'busy_timeout': 5000,
+        },
+        'engine_options': {},
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,  # 256MB
+            'cache_size': -64 * 1024,  # 64MB (negative values are KiB)
+            'busy_timeout': 5000,
+        },
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+        },
+    },
+}
+DB_PROFILE = os.environ.get('FOREST_DB_PROFILE', 'production')
+
+# Socket.IO async mode: 'eventlet' or 'gevent' when started through serve.py
+# (which monkey-patches first), otherwise auto-detected.
+ASYNC_MODE = os.environ.get('FOREST_ASYNC_MODE')
+COOPERATIVE_MODES = ('eventlet', 'gevent')
+
+if ASYNC_MODE in COOPERATIVE_MODES:
+    # Queries run on call_db's native worker threads, and a pool would hand
+    # connections out through monkey-patched (green) locks that those
+    # threads cannot wait on. SQLite connections are cheap to open.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool}
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SQLITE_PROFILES[DB_PROFILE]['engine_options']
+
 # File upload configurations
 UPLOAD_FOLDER = 'media/attachments'
 ALLOWED_EXTENSIONS = {
@@ -30,12 +113,468 @@ ALLOWED_EXTENSIONS = {
 }
 MAX_CONTENT_LENGTH = 25 * 1024 * 1024  # 25MB max file size
 
+# Media caching. Content-addressed names (<sha256>.<ext>, or a creature
+# icon requested with its ?v= fingerprint) never change, so browsers may keep
+# them forever; everything else is revalidated with a content ETag.
+CREATURE_FOLDER = 'media/forest_creatures'
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]+)?$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+REVALIDATE_MAX_AGE = 60 * 60
+
+# Front-end assets. build_assets.py bundles these with a vendored socket.io
+# client and a purged Tailwind build into fingerprinted, precompressed files
+# under ASSET_FOLDER. Without a build the sources are served directly and
+# socket.io and Tailwind come from their CDNs.
+ASSET_FOLDER = 'static/dist'
+ASSET_SOURCES = {
+    'forest.js': 'static/src/forest.js',
+    'forest.css': 'static/src/forest.css',
+    'favicon.png': 'favicon.png',
+    'logo.png': '120314577.png',
+}
+# socket.io client per wire format; the msgpack build bundles its parser
+CDN_SCRIPTS = {
+    'json': ['https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js'],
+    'msgpack': ['https://cdn.socket.io/4.0.1/socket.io.msgpack.min.js'],
+}
+CDN_STYLESHEETS = ['https://cdnjs.cloudflare.com/ajax/libs/tailwindcss/2.2.19/tailwind.min.css']
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Attachment thumbnails, built in the background after upload. Images need
+# Pillow and video poster frames need ffmpeg; without them the original
+# file is shown as before.
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_WORKERS = 2
+FFMPEG = shutil.which('ffmpeg')
+
+# Chunked, resumable uploads
+UPLOAD_PARTIAL_FOLDER = 'media/uploads_in_progress'
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB per PUT
+UPLOAD_STREAM_BLOCK = 64 * 1024
+
+# Message history paging
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 100
+# Latest public messages kept in memory, serialized, to answer request_history
+RECENT_MESSAGE_BUFFER_SIZE = 500
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+# Redis URL shared by all server processes, e.g. redis://localhost:6379/0.
+# When set, broadcasts fan out through Redis pub/sub and the online roster
+# lives in Redis, so several socketio.run processes can serve one chat.
+MESSAGE_QUEUE_URL = os.environ.get('FOREST_MESSAGE_QUEUE')
+
+# Socket.IO wire format: 'json' (default) or 'msgpack'. With msgpack, events
+# are MessagePack-encoded and colors and creature icons are sent as ids into
+# WIRE_SCHEMA (also served at /wire_schema). All clients must use the same
+# format, so the page switches to the socket.io msgpack build. Needs
+# `pip install msgpack`.
+WIRE_FORMAT = os.environ.get('FOREST_WIRE_FORMAT', 'json')
+
+# WebSocket per-message compression (permessage-deflate). Frames of at least
+# COMPRESSION_THRESHOLD bytes are deflated at COMPRESSION_LEVEL (1 fastest ..
+# 9 smallest); smaller ones (chat messages, pings, acks) go out as-is, so only
+# history pages and rosters pay for it. Level 0 turns it off, and also turns
+# off gzip for long-polling responses. The deflate window is kept across a
+# connection's messages, so even a short chat message shrinks by most of its
+# size: lower the threshold to 64 to trade CPU and per-socket compressor
+# memory for uplink bytes. See benchmarks/compression.py.
+#
+# Both knobs only apply where websockets are served by simple-websocket: the
+# threading server, and gevent without gevent-websocket. eventlet (serve.py's
+# default) uses eventlet.websocket, which deflates with its own settings, and
+# gevent-websocket does not compress at all; /stats reports in_effect: false
+# and no frames in those modes, and setting either variable there logs a
+# warning at startup.
+COMPRESSION_THRESHOLD = int(os.environ.get('FOREST_COMPRESSION_THRESHOLD', 1024))
+COMPRESSION_LEVEL = int(os.environ.get('FOREST_COMPRESSION_LEVEL', 6))
+
+class LocalBearRegistry(MutableMapping):
+    """In-process connected_bears: socket id -> bear info.
+
+    Keeps a username -> socket ids index alongside the roster so a user's
+    connections can be found without scanning every connected socket.
+    """
+
+    def __init__(self):
+        self.bears = {}
+        self.sids_by_username = {}
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def next_version(self):
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def sids_for(self, username):
+        return list(self.sids_by_username.get(username, ()))
+
+    def __getitem__(self, sid):
+        return self.bears[sid]
+
+    def __setitem__(self, sid, bear):
+        with self._lock:
+            previous = self.bears.get(sid)
+            if previous is not None:
+                self._unindex(sid, previous['username'])
+            self.bears[sid] = bear
+            self.sids_by_username.setdefault(bear['username'], set()).add(sid)
+
+    def __delitem__(self, sid):
+        with self._lock:
+            bear = self.bears.pop(sid)
+            self._unindex(sid, bear['username'])
+
+    def _unindex(self, sid, username):
+        sids = self.sids_by_username.get(username)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self.sids_by_username[username]
+
+    def __contains__(self, sid):
+        return sid in self.bears
+
+    def __iter__(self):
+        return iter(list(self.bears))
+
+    def __len__(self):
+        return len(self.bears)
+
+    def items(self):
+        return list(self.bears.items())
+
+    def values(self):
+        return list(self.bears.values())
+
+class RedisBearRegistry(MutableMapping):
+    """connected_bears backed by a Redis hash of socket id -> bear info,
+    plus one Redis set of socket ids per username"""
+
+    def __init__(self, url, key='forest:connected_bears', client=None):
+        if client is None:
+            import redis  # only needed when a message queue is configured
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.key = key
+        self.version_key = f'{key}:version'
+
+    def _user_key(self, username):
+        return f'{self.key}:user:{username}'
+
+    @property
+    def version(self):
+        return int(self.redis.get(self.version_key) or 0)
+
+    def next_version(self):
+        return self.redis.incr(self.version_key)
+
+    def sids_for(self, username):
+        return list(self.redis.smembers(self._user_key(username)))
+
+    def __getitem__(self, sid):
+        value = self.redis.hget(self.key, sid)
+        if value is None:
+            raise KeyError(sid)
+        return json.loads(value)
+
+    def __setitem__(self, sid, bear):
+        pipe = self.redis.pipeline()
+        pipe.hset(self.key, sid, json.dumps(bear))
+        pipe.sadd(self._user_key(bear['username']), sid)
+        pipe.execute()
+
+    def __delitem__(self, sid):
+        bear = self[sid]
+        pipe = self.redis.pipeline()
+        pipe.hdel(self.key, sid)
+        pipe.srem(self._user_key(bear['username']), sid)
+        removed, _ = pipe.execute()
+        if not removed:
+            raise KeyError(sid)
+
+    def __contains__(self, sid):
+        return bool(self.redis.hexists(self.key, sid))
+
+    def __iter__(self):
+        return iter(self.redis.hkeys(self.key))
+
+    def __len__(self):
+        return self.redis.hlen(self.key)
+
+    # Fetch the whole roster in one round trip rather than one per key
+    def items(self):
+        return [(sid, json.loads(value)) for sid, value in self.redis.hgetall(self.key).items()]
+
+    def values(self):
+        return [json.loads(value) for value in self.redis.hvals(self.key)]
+
+def user_room(username):
+    """Socket.IO room that every connection of a user joins"""
+    return f'user:{username}'
+
+class SharedPayload(dict):
+    """An event payload that is JSON-encoded once, however many packets
+    carry it: a broadcast, every history page it appears in, or a roster
+    snapshot sent to each connecting client. It must hold only JSON types
+    (no bytes), and is read-only once sent.
+    """
+
+    encoded = None
+    packed = None  # MessagePack form, see compact_packet_class
+
+    def to_json(self):
+        if self.encoded is None:
+            self.encoded = json.dumps(self, separators=(',', ':'))
+        return self.encoded
+
+    def __reduce__(self):
+        # Message queue backends pickle emits; other processes get a plain dict
+        return (dict, (dict(self),))
+
+class PacketJSON:
+    """JSON module for Socket.IO packets that splices in the cached
+    encoding of SharedPayloads instead of encoding them again"""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if isinstance(obj, SharedPayload):
+            return obj.to_json()
+        if isinstance(obj, list) and any(isinstance(item, (SharedPayload, list)) for item in obj):
+            return '[' + ','.join(PacketJSON.dumps(item, **kwargs) for item in obj) + ']'
+        return json.dumps(obj, **kwargs)
+
+    loads = staticmethod(engineio_json.loads)
+
+class ForestPacket(SocketIOPacket):
+    """Socket.IO packet that reuses SharedPayload encodings"""
+
+    json = PacketJSON
+
+    @classmethod
+    def data_is_binary(cls, data):
+        # SharedPayloads are JSON-only, so skip walking them for bytes:
+        # for a large roster the walk costs more than the encode
+        if isinstance(data, SharedPayload):
+            return False
+        return super().data_is_binary(data)
+
+def compact_wire(obj):
+    """Copy of an event payload with colors and creature icons swapped
+    for their WIRE_SCHEMA ids; values not in the schema are kept"""
+    if isinstance(obj, list):
+        return [compact_wire(item) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    compact = {key: compact_wire(value) for key, value in obj.items()}
+    if isinstance(compact.get('color'), str):
+        compact['color'] = WIRE_COLOR_IDS.get(compact['color'], compact['color'])
+    if isinstance(compact.get('icon'), str):
+        compact['icon'] = WIRE_ICON_IDS.get(compact['icon'], compact['icon'])
+    return compact
+
+def compact_packet_class():
+    """Socket.IO packet class for FOREST_WIRE_FORMAT=msgpack.
+
+    Payloads are packed in the compact schema (see compact_wire), and a
+    SharedPayload is packed once and spliced in, as with JSON.
+    """
+    import msgpack  # only needed for the msgpack wire format
+    from socketio.msgpack_packet import MsgPackPacket
+
+    packer = msgpack.Packer()
+
+    def pack(obj):
+        if isinstance(obj, SharedPayload):
+            if obj.packed is None:
+                obj.packed = msgpack.packb(compact_wire(obj))
+            return obj.packed
+        if isinstance(obj, list) and any(isinstance(item, (SharedPayload, list)) for item in obj):
+            return packer.pack_array_header(len(obj)) + b''.join(pack(item) for item in obj)
+        return msgpack.packb(compact_wire(obj))
+
+    class CompactPacket(MsgPackPacket):
+        def encode(self):
+            fields = self._to_dict()
+            return packer.pack_map_header(len(fields)) + b''.join(
+                msgpack.packb(key) + (pack(value) if key == 'data' else msgpack.packb(value))
+                for key, value in fields.items())
+
+    return CompactPacket
+
+class CompressionStats:
+    """Bytes saved versus CPU spent by websocket frame compression"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def record(self, size, compressed_size, cpu_seconds):
+        with self.lock:
+            self.compressed += 1
+            self.bytes_in += size
+            self.bytes_out += compressed_size
+            self.cpu_seconds += cpu_seconds
+
+    def record_skipped(self):
+        with self.lock:
+            self.skipped += 1
+
+    def stats(self):
+        with self.lock:
+            saved = self.bytes_in - self.bytes_out
+            return {
+                'in_effect': threshold_deflate_in_effect(),
+                'threshold': COMPRESSION_THRESHOLD,
+                'level': COMPRESSION_LEVEL,
+                'compressed_frames': self.compressed,
+                'small_frames': self.skipped,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': saved,
+                'cpu_seconds': round(self.cpu_seconds, 6),
+                'kb_saved_per_cpu_ms': round(saved / 1024 / (self.cpu_seconds * 1000), 2) if self.cpu_seconds else None
+            }
+
+compression_stats = CompressionStats()
+
+class ThresholdDeflate(PerMessageDeflate):
+    """permessage-deflate that only compresses large messages.
+
+    RFC 7692 sets the compressed bit per message, so frames under
+    COMPRESSION_THRESHOLD are sent uncompressed on the same connection
+    (and never allocate a compressor); the rest are deflated at
+    COMPRESSION_LEVEL. Installed in place of simple-websocket's stock
+    extension, which deflates every frame at zlib's default level.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compress_message = False
+
+    def accept(self, offer):
+        if COMPRESSION_LEVEL <= 0:
+            return None
+        return super().accept(offer)
+
+    def frame_outbound(self, proto, opcode, rsv, data, fin):
+        if opcode in (WebSocketOpcode.TEXT, WebSocketOpcode.BINARY):
+            # The first frame decides for the whole (fragmented) message
+            self._compress_message = len(data) >= COMPRESSION_THRESHOLD
+            if not self._compress_message:
+                compression_stats.record_skipped()
+        if not self._compressible_opcode(opcode) or not self._compress_message:
+            return (rsv, data)
+        if self._compressor is None:
+            bits = self.client_max_window_bits if proto.client else self.server_max_window_bits
+            self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -int(bits))
+        start = time.thread_time()
+        rsv, compressed = super().frame_outbound(proto, opcode, rsv, data, fin)
+        compression_stats.record(len(data), len(compressed), time.thread_time() - start)
+        return (rsv, compressed)
+
+# simple-websocket (threading mode, and gevent without gevent-websocket)
+# builds its extension list from this module global on every handshake
+simple_websocket.ws.PerMessageDeflate = ThresholdDeflate
+
+def threshold_deflate_in_effect():
+    """Whether websockets go through simple-websocket and so ThresholdDeflate"""
+    if socketio.async_mode == 'eventlet':
+        return False
+    if socketio.async_mode == 'gevent':
+        # engine.io prefers gevent-websocket whenever it is installed
+        return importlib.util.find_spec('geventwebsocket') is None
+    return True
+
 db = SQLAlchemy(app)
-socketio = SocketIO(app)
-connected_bears = {}
+migrate = Migrate(app, db)
+socketio = SocketIO(app, message_queue=MESSAGE_QUEUE_URL, async_mode=ASYNC_MODE,
+                    serializer=compact_packet_class() if WIRE_FORMAT == 'msgpack' else ForestPacket,
+                    http_compression=COMPRESSION_LEVEL > 0)
+if not threshold_deflate_in_effect() and any(
+        name in os.environ for name in ('FOREST_COMPRESSION_THRESHOLD', 'FOREST_COMPRESSION_LEVEL')):
+    app.logger.warning(
+        f"FOREST_COMPRESSION_THRESHOLD and FOREST_COMPRESSION_LEVEL do not apply to websocket frames "
+        f"under {socketio.async_mode}; run serve.py --mode threading (or gevent without gevent-websocket) "
+        f"to use them")
+connected_bears = RedisBearRegistry(MESSAGE_QUEUE_URL) if MESSAGE_QUEUE_URL else LocalBearRegistry()
+
+def native_lock():
+    """A real OS lock, even after eventlet or gevent monkey-patching.
+
+    Use it for state that call_db's worker threads share with greenlets: a
+    native thread cannot wait on a green lock. Sections guarded by these
+    locks never yield, so holding one in a greenlet cannot stall the hub.
+    """
+    if ASYNC_MODE == 'eventlet':
+        from eventlet.patcher import original
+        return original('threading').Lock()
+    if ASYNC_MODE == 'gevent':
+        from gevent.monkey import get_original
+        return get_original('threading', 'Lock')()
+    return threading.Lock()
+
+def call_db(func, *args, **kwargs):
+    """Run blocking database work off the event loop, in an app context.
+
+    Under eventlet or gevent the call runs on the hub's native thread pool,
+    so a slow SQLite read or fsync only parks the calling greenlet; in
+    threading mode it runs inline. func must not depend on the request
+    context, and should return plain data rather than ORM objects.
+    """
+    def run():
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    # Follow FOREST_ASYNC_MODE, not socketio.async_mode: Flask-SocketIO
+    # picks eventlet or gevent whenever installed, patched or not
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(run)
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(run)
+    if has_app_context():
+        return func(*args, **kwargs)
+    return run()
+
+# Roster changes within this many seconds go out as one merged broadcast
+PRESENCE_BROADCAST_WINDOW = float(os.environ.get('FOREST_PRESENCE_WINDOW', '0.25'))
+
+# Write-behind message persistence, enabled with FOREST_WRITE_BEHIND=1.
+# Messages are broadcast as soon as they have an id and written by a
+# background thread in transactions of up to WRITE_BATCH_SIZE rows, at most
+# WRITE_MAX_DELAY seconds after they arrive. Ids are handed out in memory,
+# so this needs a single server process and is ignored with a message queue.
+# The queue is flushed on normal exit and on SIGTERM, but a process that is
+# killed outright loses what was queued, and the next start continues from
+# the lower MAX(id): those ids are handed out again, and clients that saw
+# the lost messages drop the new ones as already seen until they reload.
+WRITE_BEHIND = os.environ.get('FOREST_WRITE_BEHIND') == '1'
+WRITE_BATCH_SIZE = int(os.environ.get('FOREST_WRITE_BATCH_SIZE', '200'))
+WRITE_MAX_DELAY = float(os.environ.get('FOREST_WRITE_MAX_DELAY', '0.05'))
+WRITE_RETRIES = 3
+if WRITE_BEHIND and MESSAGE_QUEUE_URL:
+    app.logger.warning("FOREST_WRITE_BEHIND is ignored when FOREST_MESSAGE_QUEUE is set")
+    WRITE_BEHIND = False
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the active profile's pragmas to every new SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PROFILES[DB_PROFILE]['pragmas'].items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
 
 # Forest theme configurations
 FOREST_COLORS = {
@@ -62,17 +601,51 @@ FOREST_CREATURES = {
     'owl': {'file': 'owl.png', 'display': 'Wise Owl'}
 }
 
+# Color name -> hex code, flattened once from FOREST_COLORS
+COLOR_CODES = {color['name']: color['code'] for category in FOREST_COLORS.values() for color in category}
+DEFAULT_COLOR_CODE = '#8FBC6B'  # spring_leaf
+
+# Seconds a cached sender profile is trusted. Local color and icon changes
+# invalidate it straight away; this bounds staleness across processes.
+PROFILE_CACHE_TTL = 300
+
+class EpochMillis(db.TypeDecorator):
+    """An aware datetime stored as integer milliseconds since the Unix epoch
+    (UTC), so the column sorts, indexes and range-scans as a plain integer"""
+
+    impl = db.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        if value.tzinfo is None:
+            raise ValueError(f"naive datetime {value} has no zone to store it from")
+        return (value - EPOCH) // timedelta(milliseconds=1)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return EPOCH + timedelta(milliseconds=value)
+
 # Database Models
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=eastern_now)
-    last_active = db.Column(db.DateTime, default=eastern_now)
+    created_at = db.Column(EpochMillis, default=utc_now)
+    last_active = db.Column(EpochMillis, default=utc_now)
     socket_id = db.Column(db.String(100), nullable=True)
 
     user = db.relationship('User', backref='sessions')
 
+    __table_args__ = (
+        # Login, logout and connect look sessions up by user (and session id)
+        db.Index('ix_session_user_id_session_id', 'user_id', 'session_id'),
+        # cleanup_old_sessions range-scans on last activity
+        db.Index('ix_session_last_active', 'last_active'),
+    )
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -80,29 +653,25 @@ class User(db.Model):
     color_name = db.Column(db.String(30), default='spring_leaf')
     icon_name = db.Column(db.String(30), default='bear')
     active_session = db.Column(db.String(100), nullable=True)
-    last_seen = db.Column(db.DateTime, nullable=True)
+    last_seen = db.Column(EpochMillis, nullable=True)
 
     def clear_session(self):
         self.active_session = None
-        self.last_seen = eastern_now()
+        self.last_seen = utc_now()
         db.session.commit()
 
     @property
     def color_code(self):
-        for category in FOREST_COLORS.values():
-            for color in category:
-                if color['name'] == self.color_name:
-                    return color['code']
-        return '#8FBC6B'  # default spring_leaf
+        return COLOR_CODES.get(self.color_name, DEFAULT_COLOR_CODE)
 
     @property
     def icon_path(self):
-        return f'/media/forest_creatures/{FOREST_CREATURES[self.icon_name]["file"]}'
+        return creature_icon_url(self.icon_name)
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String(500), nullable=False)
-    timestamp = db.Column(db.DateTime, default=eastern_now)
+    timestamp = db.Column(EpochMillis, default=utc_now)
     username = db.Column(db.String(80), nullable=False)
     is_private = db.Column(db.Boolean, default=False)
     recipient = db.Column(db.String(80), nullable=True)
@@ -111,46 +680,1004 @@ class Message(db.Model):
 
     sender = db.relationship('User', backref='messages', foreign_keys=[sender_id])
 
+    __table_args__ = (
+        # History pages are ordered and keyed on (timestamp, id)
+        db.Index('ix_message_timestamp_id', 'timestamp', 'id'),
+        # A user's DMs are found from either side of the conversation
+        db.Index('ix_message_recipient_timestamp', 'recipient', 'timestamp'),
+        db.Index('ix_message_sender_id_timestamp', 'sender_id', 'timestamp'),
+    )
+
+class ContentBlob(db.Model):
+    """An attachment file stored once under the SHA-256 of its contents"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(EpochMillis, default=utc_now)
+
 class FileAttachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     mime_type = db.Column(db.String(127), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
-    upload_date = db.Column(db.DateTime, default=eastern_now)
+    upload_date = db.Column(EpochMillis, default=utc_now)
     message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
     uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    content_hash = db.Column(db.String(64), db.ForeignKey('content_blob.sha256'), nullable=True)
+    thumbnail_filename = db.Column(db.String(255), nullable=True)
 
     message = db.relationship('Message', backref='attachments')
     uploader = db.relationship('User', backref='uploads')
+    blob = db.relationship('ContentBlob', backref='attachments')
+
+    __table_args__ = (
+        db.Index('ix_file_attachment_message_id', 'message_id'),
+        db.Index('ix_file_attachment_content_hash', 'content_hash'),
+    )
+
+class PendingUpload(db.Model):
+    """A chunked upload that has not been finalized yet"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(127), nullable=True)
+    total_size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(EpochMillis, default=utc_now)
+    last_active = db.Column(EpochMillis, default=utc_now)
+
+    __table_args__ = (
+        # cleanup_stale_uploads range-scans on last activity
+        db.Index('ix_pending_upload_last_active', 'last_active'),
+    )
+
+    @property
+    def partial_path(self):
+        return os.path.join(UPLOAD_PARTIAL_FOLDER, self.id)
+
+    def status(self):
+        return {
+            'upload_id': self.id,
+            'received': self.received,
+            'total_size': self.total_size,
+            'chunk_size': UPLOAD_CHUNK_SIZE
+        }
 
 # Utility Functions
 def allowed_file(filename):
     """Check if the file extension is allowed"""
-    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    ext = file_extension(filename)
     return any(ext in extensions for extensions in ALLOWED_EXTENSIONS.values())
 
 def get_file_type(filename):
     """Get the type category of the file"""
-    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    ext = file_extension(filename)
     for file_type, extensions in ALLOWED_EXTENSIONS.items():
         if ext in extensions:
             return file_type
     return None
 
-def cleanup_old_sessions():
-    """Cleanup sessions older than 24 hours"""
+def file_extension(filename):
+    """Lower-case extension of a filename, without the dot"""
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def hash_file(path):
+    """SHA-256 hex digest of a file, read in blocks"""
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(UPLOAD_STREAM_BLOCK), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+def discard_temp_file(path):
+    """Remove a temporary file if it is still there.
+
+    Files in the in-progress folder that no PendingUpload refers to are
+    never swept by cleanup_stale_uploads, so failed work must remove its own.
+    """
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def save_stream_to_partial(stream):
+    """Stream an upload into the in-progress folder, hashing it on the way.
+
+    Returns the temporary path and the SHA-256 hex digest of the contents.
+    """
+    os.makedirs(UPLOAD_PARTIAL_FOLDER, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_PARTIAL_FOLDER, os.urandom(16).hex())
+    checksum = hashlib.sha256()
+    try:
+        with open(temp_path, 'wb') as partial:
+            for block in iter(lambda: stream.read(UPLOAD_STREAM_BLOCK), b''):
+                partial.write(block)
+                checksum.update(block)
+    except Exception:
+        discard_temp_file(temp_path)
+        raise
+    return temp_path, checksum.hexdigest()
+
+def store_content(temp_path, digest, extension):
+    """Add a fully written file to the content-addressed attachment store.
+
+    Files are named <sha256>.<ext>, so names never collide and identical
+    uploads share one file on disk: if the content is already stored, the
+    new copy is discarded and the existing blob gains a reference.
+    Returns the ContentBlob; the caller commits. Call it before adding other
+    changes to the session, since a lost insert race rolls the session back.
+    """
+    blob = db.session.get(ContentBlob, digest)
+    if blob is None:
+        filename = f'{digest}.{extension}' if extension else digest
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        os.replace(temp_path, file_path)
+
+        try:
+            blob = ContentBlob(sha256=digest, filename=filename,
+                               file_size=os.path.getsize(file_path), ref_count=1)
+            db.session.add(blob)
+            db.session.flush()
+            return blob
+        except IntegrityError:
+            # Another upload of the same content won the race; the file it
+            # stored is byte-identical, so just take a reference below.
+            db.session.rollback()
+            blob = db.session.get(ContentBlob, digest)
+    elif os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    blob.ref_count = ContentBlob.ref_count + 1
+    db.session.flush()
+    return blob
+
+# (path, mtime, size) -> SHA-256 of the contents
+_content_etags = {}
+
+def content_etag(path):
+    """SHA-256 of a file's contents, cached until the file changes"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    etag = _content_etags.get(key)
+    if etag is None:
+        etag = _content_etags[key] = hash_file(path)
+    return etag
+
+# icon name -> fingerprinted URL
+_creature_icon_urls = {}
+
+def creature_icon_url(icon_name):
+    """URL of a creature icon, fingerprinted with its content hash"""
+    url = _creature_icon_urls.get(icon_name)
+    if url is None:
+        filename = FOREST_CREATURES[icon_name]['file']
+        url = f'/media/forest_creatures/{filename}'
+        path = os.path.join(app.root_path, CREATURE_FOLDER, filename)
+        if os.path.exists(path):
+            url += f'?v={content_etag(path)[:12]}'
+        _creature_icon_urls[icon_name] = url
+    return url
+
+# Tables the msgpack wire format's color and icon ids index into
+WIRE_SCHEMA = {
+    'format': WIRE_FORMAT,
+    'colors': list(COLOR_CODES.values()),
+    'icons': [creature_icon_url(icon_name) for icon_name in FOREST_CREATURES],
+}
+WIRE_COLOR_IDS = {code: index for index, code in enumerate(WIRE_SCHEMA['colors'])}
+WIRE_ICON_IDS = {url: index for index, url in enumerate(WIRE_SCHEMA['icons'])}
+
+def send_cached_file(directory, filename, fingerprint=None):
+    """Serve a file with a strong content ETag, byte ranges and 304 handling.
+
+    Content-addressed names use their hash as the ETag and are marked
+    immutable, as are requests whose ?v= fingerprint matches the current
+    contents; anything else is hashed once and revalidated hourly.
+    """
+    path = safe_join(os.path.join(app.root_path, directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    match = CONTENT_ADDRESSED_NAME.match(os.path.basename(filename))
+    if match:
+        etag = match.group(1)
+        immutable = True
+    else:
+        etag = content_etag(path)
+        immutable = bool(fingerprint) and etag.startswith(fingerprint)
+
+    response = send_from_directory(directory, filename, etag=etag,
+                                   max_age=IMMUTABLE_MAX_AGE if immutable else REVALIDATE_MAX_AGE)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+def send_precompressed(directory, filename):
+    """Serve a fingerprinted bundle, using its .br or .gz twin when accepted.
+
+    The name changes whenever the contents do, so it doubles as the ETag and
+    the response can be cached forever.
+    """
+    path = safe_join(os.path.join(app.root_path, directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding = None
+    for candidate, suffix in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding = candidate
+            filename += suffix
+            break
+
+    response = send_from_directory(directory, filename, mimetype=mimetype,
+                                   etag=filename, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def load_asset_manifest():
+    """Map of logical asset names to built file names, from build_assets.py"""
+    path = os.path.join(app.root_path, ASSET_FOLDER, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Could not read asset manifest: {e}")
+        return {}
+
+asset_manifest = load_asset_manifest()
+
+def asset_url(name, built=True):
+    """URL of a front-end asset: the built file, or the fingerprinted source"""
+    if built and name in asset_manifest:
+        return f'/assets/{asset_manifest[name]}'
+    url = f'/assets/{name}'
+    path = os.path.join(app.root_path, ASSET_SOURCES[name])
+    if os.path.exists(path):
+        url += f'?v={content_etag(path)[:12]}'
+    return url
+
+def page_assets():
+    """Script, stylesheet and image URLs for the page, resolved once at startup"""
+    # The built bundles include the socket.io client for one wire format
+    bundle = 'forest.msgpack.js' if WIRE_FORMAT == 'msgpack' else 'forest.js'
+    if bundle in asset_manifest:
+        scripts = [f'/assets/{asset_manifest[bundle]}']
+    else:
+        scripts = CDN_SCRIPTS[WIRE_FORMAT] + [asset_url('forest.js', built=False)]
+    stylesheets = [] if asset_manifest else list(CDN_STYLESHEETS)
+    return {
+        'scripts': scripts,
+        'stylesheets': stylesheets + [asset_url('forest.css')],
+        'favicon': asset_url('favicon.png'),
+        'logo': asset_url('logo.png'),
+    }
+
+PAGE_ASSETS = page_assets()
+
+thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS,
+                                        thread_name_prefix='thumbnails')
+
+def render_thumbnail(source_path, mime_type):
+    """Write a downscaled preview of an image, or a poster frame of a video.
+
+    Returns the temporary path and extension, or None if no preview can be
+    made for this file.
+    """
+    os.makedirs(UPLOAD_PARTIAL_FOLDER, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_PARTIAL_FOLDER, os.urandom(16).hex())
+
+    try:
+        # Animated GIFs would lose their animation, so they are shown as-is
+        if mime_type.startswith('image/') and mime_type != 'image/gif' and Image is not None:
+            with Image.open(source_path) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                image.save(temp_path, 'WEBP', quality=80)
+            return temp_path, 'webp'
+
+        if mime_type.startswith('video/') and FFMPEG:
+            width, height = THUMBNAIL_SIZE
+            subprocess.run([
+                FFMPEG, '-loglevel', 'error', '-y', '-ss', '1', '-i', source_path,
+                '-frames:v', '1', '-f', 'image2', '-c:v', 'mjpeg',
+                '-vf', f'scale=w={width}:h={height}:force_original_aspect_ratio=decrease',
+                temp_path
+            ], check=True, timeout=60)
+            if os.path.getsize(temp_path) > 0:
+                return temp_path, 'jpg'
+    except Exception:
+        # A failed ffmpeg run or Pillow error can leave a partial file
+        discard_temp_file(temp_path)
+        raise
+
+    discard_temp_file(temp_path)
+    return None
+
+def generate_thumbnail(attachment_id):
+    """Build and record the thumbnail for an attachment (runs in a worker)"""
+    with app.app_context():
+        try:
+            attachment = db.session.get(FileAttachment, attachment_id)
+            if attachment is None or attachment.thumbnail_filename:
+                return
+
+            # Byte-identical uploads share one thumbnail
+            if attachment.content_hash:
+                twin = FileAttachment.query.filter(
+                    FileAttachment.content_hash == attachment.content_hash,
+                    FileAttachment.thumbnail_filename.isnot(None)
+                ).first()
+                if twin:
+                    # The shared thumbnail blob gains a reference, as in store_content
+                    ContentBlob.query.filter_by(filename=twin.thumbnail_filename).update(
+                        {ContentBlob.ref_count: ContentBlob.ref_count + 1})
+                    attachment.thumbnail_filename = twin.thumbnail_filename
+                    db.session.commit()
+                    thumbnail_ready(attachment)
+                    return
+
+            source_path = os.path.join(app.config['UPLOAD_FOLDER'], attachment.filename)
+            rendered = render_thumbnail(source_path, attachment.mime_type)
+            if rendered is None:
+                return
+
+            temp_path, extension = rendered
+            try:
+                blob = store_content(temp_path, hash_file(temp_path), extension)
+            finally:
+                # store_content moves or removes it unless it failed first
+                discard_temp_file(temp_path)
+            attachment = db.session.get(FileAttachment, attachment_id)
+            attachment.thumbnail_filename = blob.filename
+            db.session.commit()
+            thumbnail_ready(attachment)
+        except Exception as e:
+            app.logger.error(f"Thumbnail generation error for attachment {attachment_id}: {e}")
+            db.session.rollback()
+
+def thumbnail_ready(attachment):
+    """Show a new thumbnail in the buffered copy of the attachment's message"""
+    if attachment.message_id is not None:
+        recent_messages.update_attachment(attachment.message_id, serialize_attachment(attachment))
+
+def schedule_thumbnail(attachment):
+    """Queue thumbnail generation without holding up the upload response"""
+    if get_file_type(attachment.filename) in ('image', 'video'):
+        thumbnail_executor.submit(call_db, generate_thumbnail, attachment.id)
+
+def serialize_attachment(attachment):
+    """Build the client payload for a file attachment"""
+    attachment_data = {
+        'filename': attachment.original_filename,
+        'url': f'/attachments/{attachment.filename}',
+        'mime_type': attachment.mime_type,
+        'file_size': attachment.file_size
+    }
+    if attachment.thumbnail_filename:
+        attachment_data['thumbnail_url'] = f'/attachments/{attachment.thumbnail_filename}'
+    return attachment_data
+
+def serialize_message(msg, profile, attachments=None):
+    """Build the client payload for a message, given its sender's cached profile.
+
+    attachments defaults to msg.attachments; pass it to skip the lazy load.
+    """
+    if attachments is None:
+        attachments = msg.attachments
+    message_data = {
+        'id': msg.id,
+        'sender': msg.username,
+        'content': msg.content,
+        'timestamp': local_time(msg.timestamp).isoformat(),
+        'private': msg.is_private,
+        'color': profile['color'],
+        'icon': profile['icon']
+    }
+    if msg.is_private:
+        # Only the two bears in the conversation ever receive it
+        message_data['recipient'] = msg.recipient
+
+    # Add attachment info if present
+    if attachments:
+        message_data['attachment'] = serialize_attachment(attachments[0])
+
+    return message_data
+
+def parse_history_cursor(data):
+    """Read the before_id/before_timestamp cursor and page size from a request"""
+    data = data or {}
+    before_id = data.get('before_id')
+    before_timestamp = data.get('before_timestamp')
+    limit = data.get('limit') or HISTORY_PAGE_SIZE
+
+    before_id = int(before_id) if before_id is not None else None
+    if before_timestamp:
+        before_timestamp = datetime.fromisoformat(before_timestamp)
+        if before_timestamp.tzinfo is None:
+            # Pages served before timestamps were stored in UTC carried local times
+            before_timestamp = LOCAL_TIMEZONE.localize(before_timestamp)
+    limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+    return before_id, before_timestamp, limit
+
+def public_messages():
+    """Messages everyone may see"""
+    return Message.query.filter(Message.is_private.isnot(True))
+
+def private_messages(viewer):
+    """Private messages the viewer sent or received.
+
+    Each side of the OR has its own index (ix_message_recipient_timestamp,
+    ix_message_sender_id_timestamp), so SQLite never scans other users' DMs.
+    """
+    return Message.query.filter(
+        Message.is_private.is_(True),
+        db.or_(Message.recipient == viewer['username'], Message.sender_id == viewer['id']))
+
+def conversation_messages(viewer, other_username):
+    """Private messages between the viewer and one other user"""
+    return Message.query.filter(
+        Message.is_private.is_(True),
+        db.or_(db.and_(Message.sender_id == viewer['id'], Message.recipient == other_username),
+               db.and_(Message.recipient == viewer['username'], Message.username == other_username)))
+
+def newest_rows(query, before_id=None, before_timestamp=None, limit=HISTORY_PAGE_SIZE):
+    """Up to limit Message rows from query older than the cursor, newest first.
+
+    Pages are keyed on (timestamp, id) rather than an offset, so loading an
+    older page costs the same no matter how far back the client has scrolled.
+    """
+    if before_timestamp is not None:
+        if before_id is not None:
+            # Row-value comparison lets SQLite seek the (.., timestamp, id) indexes
+            query = query.filter(tuple_(Message.timestamp, Message.id) < (before_timestamp, before_id))
+        else:
+            query = query.filter(Message.timestamp < before_timestamp)
+    elif before_id is not None:
+        query = query.filter(Message.id < before_id)
+
+    # Batch-load attachments with a single IN query; senders come from the
+    # profile cache in serialize_history. This avoids a User row and a lazy
+    # attachment load per message.
+    return (query.options(selectinload(Message.attachments))
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit)
+            .all())
+
+def row_order(msg):
+    return (msg.timestamp or EPOCH, msg.id)
+
+def serialized_order(message_data):
+    return (datetime.fromisoformat(message_data['timestamp']), message_data['id'])
+
+def merge_newest(first, second, limit, key):
+    """Merge two newest-first lists into one, keeping the newest limit entries"""
+    return sorted(first + second, key=key, reverse=True)[:limit]
+
+def fetch_history(before_id=None, before_timestamp=None, limit=HISTORY_PAGE_SIZE, viewer=None):
+    """Return up to limit serialized messages older than the cursor, newest
+    first: public messages plus, given a viewer, the DMs they sent or received"""
+    rows = newest_rows(public_messages(), before_id, before_timestamp, limit)
+    if viewer is not None:
+        private_rows = newest_rows(private_messages(viewer), before_id, before_timestamp, limit)
+        rows = merge_newest(rows, private_rows, limit, row_order)
+    return serialize_history(rows)
+
+def fetch_conversation(viewer, other_username, before_id=None, before_timestamp=None, limit=HISTORY_PAGE_SIZE):
+    """A page of the DMs between viewer and other_username, newest first"""
+    # Fetch one extra row to tell the client whether to keep scrolling
+    rows = newest_rows(conversation_messages(viewer, other_username),
+                       before_id, before_timestamp, limit + 1)
+    return {
+        'with': other_username,
+        'messages': serialize_history(rows[:limit]),
+        'has_more': len(rows) > limit
+    }
+
+def fetch_since(query, since_id, limit=HISTORY_PAGE_SIZE):
+    """Return the messages from query newer than since_id, oldest first, or
+    None if there are more than limit of them"""
+    rows = (query.options(selectinload(Message.attachments))
+            .filter(Message.id > since_id)
+            .order_by(Message.id)
+            .limit(limit + 1)
+            .all())
+    if len(rows) > limit:
+        return None
+    return serialize_history(rows)
+
+def latest_history(viewer, limit=HISTORY_PAGE_SIZE):
+    """The first history page for viewer: public messages from the
+    recent-message buffer merged with the viewer's own DMs"""
+    page = recent_messages.latest(limit)
+    if viewer is None:
+        return page
+    private = serialize_history(newest_rows(private_messages(viewer), limit=limit))
+    return merge_newest(page, private, limit, serialized_order)
+
+def missed_history(viewer, since_id, limit=HISTORY_PAGE_SIZE):
+    """What viewer missed after since_id, oldest first, or None if more than limit"""
+    missed = recent_messages.since(since_id, limit)
+    if missed is None:
+        return None
+    if viewer is not None:
+        private = fetch_since(private_messages(viewer), since_id, limit)
+        if private is None:
+            return None
+        missed = sorted(missed + private, key=lambda message_data: message_data['id'])
+    return missed if len(missed) <= limit else None
+
+def serialize_history(rows):
+    """Serialize Message rows, resolving all their senders at once"""
+    profiles = user_profiles.get_many(msg.sender_id for msg in rows if msg.sender_id is not None)
+    legacy_profiles = user_profiles.for_usernames(msg.username for msg in rows if msg.sender_id is None)
+
+    history = []
+    for msg in rows:
+        if msg.sender_id is not None:
+            profile = profiles.get(msg.sender_id)
+        else:
+            profile = legacy_profiles.get(msg.username)
+        # Messages from deleted users are left out, as the old join did
+        if profile is not None:
+            history.append(serialize_message(msg, profile))
+    return history
+
+def bear_info(bear):
+    """Build the public roster entry for a connected bear"""
+    return {'username': bear['username'], 'icon': bear['icon']}
+
+def presence_snapshot():
+    """Full roster, tagged with the presence version it reflects"""
+    # Read the version first: changes racing with the roster read, or still
+    # waiting in the broadcaster, go out with a later version, and
+    # re-applying them on the client is harmless.
+    version = connected_bears.version
+    bears = [bear_info(bear) for bear in connected_bears.values()]
+    return SharedPayload(version=version, bears=bears, count=len(bears))
+
+class PresenceSnapshots:
+    """The roster snapshot, built and encoded once per presence version.
+
+    Every roster change since a snapshot was built is still due to go out
+    as a bear_delta with a later version, so clients can be sent the same
+    snapshot until the version moves on. A reconnect storm then costs one
+    roster scan and one encode instead of one per connecting socket.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.built = 0
+        self.hits = 0
+
+    def get(self):
+        version = connected_bears.version
+        with self.lock:
+            if self.snapshot is not None and self.snapshot['version'] == version:
+                self.hits += 1
+                return self.snapshot
+        snapshot = presence_snapshot()
+        with self.lock:
+            self.snapshot = snapshot
+            self.built += 1
+        return snapshot
+
+    def stats(self):
+        with self.lock:
+            return {'built': self.built, 'hits': self.hits}
+
+presence_snapshots = PresenceSnapshots()
+
+class PresenceBroadcaster:
+    """Coalesces roster changes into one bear_delta broadcast per window.
+
+    A burst of connects (e.g. every client reconnecting after a restart)
+    turns into a handful of merged broadcasts instead of one per socket.
+    Only the latest change per username within a window is sent.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = {}  # username -> bear info, or None if the bear left
+        self.pending_events = 0
+        self.flush_scheduled = False
+        self.events_received = 0
+        self.events_coalesced = 0
+        self.broadcasts_sent = 0
+
+    def bear_joined(self, bear):
+        self._queue(bear['username'], bear)
+
+    def bear_left(self, username):
+        self._queue(username, None)
+
+    def _queue(self, username, bear):
+        with self.lock:
+            self.events_received += 1
+            self.pending_events += 1
+            self.pending[username] = bear
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+
+        if self.window > 0:
+            socketio.start_background_task(self._flush_later)
+        else:
+            self.flush()
+
+    def _flush_later(self):
+        socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            batched_events, self.pending_events = self.pending_events, 0
+            self.flush_scheduled = False
+        if not pending:
+            return
+
+        socketio.emit('bear_delta', {
+            'version': connected_bears.next_version(),
+            'joined': [bear for bear in pending.values() if bear is not None],
+            'left': [username for username, bear in pending.items() if bear is None],
+            'count': len(connected_bears)
+        }, namespace='/')
+        with self.lock:
+            self.broadcasts_sent += 1
+            self.events_coalesced += batched_events - 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'window_seconds': self.window,
+                'events_received': self.events_received,
+                'events_coalesced': self.events_coalesced,
+                'events_pending': self.pending_events,
+                'broadcasts_sent': self.broadcasts_sent
+            }
+
+presence_broadcaster = PresenceBroadcaster(PRESENCE_BROADCAST_WINDOW)
+
+class MessageWriter:
+    """Persists messages in batched transactions on a background thread.
+
+    handle_message assigns the id and timestamp itself and broadcasts right
+    away; the row reaches SQLite once batch_size rows are waiting or
+    max_delay seconds have passed, whichever comes first.
+    """
+
+    def __init__(self, batch_size, max_delay):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.lock = native_lock()
+        self.last_id = None
+        self.thread = None
+        self.messages_written = 0
+        self.batches_written = 0
+        self.messages_dropped = 0
+
+    def next_id(self):
+        """Allocate a message id, continuing from the largest one stored"""
+        with self.lock:
+            if self.last_id is None:
+                self.last_id = db.session.query(db.func.max(Message.id)).scalar() or 0
+            self.last_id += 1
+            return self.last_id
+
+    def submit(self, message, attachment_id=None):
+        """Queue a transient Message (with its id set) for writing"""
+        row = {column.name: getattr(message, column.name) for column in Message.__table__.columns}
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+                self.thread.start()
+        self.queue.put((row, attachment_id))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            call_db(self._write, batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, batch):
+        rows = [row for row, attachment_id in batch]
+        links = [{'attachment_id': attachment_id, 'linked_message_id': row['id']}
+                 for row, attachment_id in batch if attachment_id]
+        attachments = FileAttachment.__table__
+        link_attachment = (attachments.update()
+                           .where(attachments.c.id == db.bindparam('attachment_id'))
+                           .values(message_id=db.bindparam('linked_message_id')))
+
+        for attempt in range(1, WRITE_RETRIES + 1):
+            with app.app_context():
+                try:
+                    db.session.execute(Message.__table__.insert(), rows)
+                    if links:
+                        db.session.execute(link_attachment, links)
+                    db.session.commit()
+                    with self.lock:
+                        self.messages_written += len(rows)
+                        self.batches_written += 1
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Message write error (attempt {attempt}/{WRITE_RETRIES}): {e}")
+            time.sleep(attempt * self.max_delay)
+
+        with self.lock:
+            self.messages_dropped += len(rows)
+        app.logger.error(f"Dropped {len(rows)} messages (ids {rows[0]['id']}-{rows[-1]['id']})")
+
+    def flush(self):
+        """Block until every queued message has been written"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'batch_size': self.batch_size,
+                'max_delay_seconds': self.max_delay,
+                'messages_pending': self.queue.unfinished_tasks,
+                'messages_written': self.messages_written,
+                'batches_written': self.batches_written,
+                'messages_dropped': self.messages_dropped
+            }
+
+message_writer = MessageWriter(WRITE_BATCH_SIZE, WRITE_MAX_DELAY)
+# Write out whatever is still queued when the server shuts down
+atexit.register(message_writer.flush)
+
+def flush_and_exit(signum, frame):
+    """SIGTERM handler: atexit hooks do not run on a signal, so flush first"""
+    message_writer.flush()
+    sys.exit(128 + signum)
+
+class ProfileCache:
+    """Sender presentation data (username, color, icon) by user id.
+
+    Serializing a message only needs these few fields, so they are loaded
+    once per user and kept for ttl seconds rather than fetching the User
+    row for every message. /change_color and /change_icon invalidate the
+    user's entry.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = native_lock()
+        self.profiles = {}  # user id -> (expires at, profile)
+        self.ids_by_username = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build(user_id, username, color_name, icon_name):
+        return {
+            'id': user_id,
+            'username': username,
+            'color_name': color_name,
+            'color': COLOR_CODES.get(color_name, DEFAULT_COLOR_CODE),
+            'icon': creature_icon_url(icon_name)
+        }
+
+    def _load(self, criterion):
+        rows = (db.session.query(User.id, User.username, User.color_name, User.icon_name)
+                .filter(criterion)
+                .all())
+        loaded = {row.id: self.build(*row) for row in rows}
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            for user_id, profile in loaded.items():
+                self.profiles[user_id] = (expires_at, profile)
+                self.ids_by_username[profile['username']] = user_id
+        return loaded
+
+    def get_many(self, user_ids):
+        """Profiles for the given user ids, loading any misses in one query"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self.lock:
+            for user_id in set(user_ids):
+                entry = self.profiles.get(user_id)
+                if entry is not None and entry[0] > now:
+                    found[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            found.update(self._load(User.id.in_(missing)))
+        return found
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def for_usernames(self, usernames):
+        """Profiles by username, for old messages stored without a sender_id"""
+        usernames = set(usernames)
+        if not usernames:
+            return {}
+        with self.lock:
+            known_ids = [self.ids_by_username[name] for name in usernames if name in self.ids_by_username]
+        profiles = {profile['username']: profile for profile in self.get_many(known_ids).values()}
+        missing = usernames - profiles.keys()
+        if missing:
+            loaded = self._load(User.username.in_(missing))
+            profiles.update((profile['username'], profile) for profile in loaded.values())
+        return profiles
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.profiles.pop(user_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ttl_seconds': self.ttl,
+                'cached': len(self.profiles),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+user_profiles = ProfileCache(PROFILE_CACHE_TTL)
+
+class RecentMessages:
+    """Bounded buffer of the latest public messages, already serialized.
+
+    Loaded from the database on first use and appended to by
+    handle_message, so history requests (every connect and reconnect) are
+    answered without a query. Entries are patched when a sender changes
+    color or icon, or an attachment gets its thumbnail, to stay identical
+    to what fetch_history would return.
+
+    Other processes' messages never reach this buffer, so it is disabled
+    when a message queue is configured and history goes to the database.
+    """
+
+    def __init__(self, size, enabled=True):
+        self.size = size
+        self.enabled = enabled
+        self.lock = native_lock()
+        self.messages = deque(maxlen=size)  # oldest first
+        self.loaded = False
+        self.loaded_up_to = 0
+        self.hits = 0
+
+    def _load(self):
+        # Caller holds the lock
+        if not self.loaded:
+            page = fetch_history(limit=self.size)
+            self.messages.extend(SharedPayload(message) for message in reversed(page))
+            self.loaded_up_to = max((message['id'] for message in page), default=0)
+            self.loaded = True
+
+    def load(self):
+        if self.enabled:
+            with self.lock:
+                self._load()
+
+    def latest(self, limit=HISTORY_PAGE_SIZE):
+        """The newest public messages, newest first, like fetch_history"""
+        if not self.enabled or limit > self.size:
+            return fetch_history(limit=limit)
+        with self.lock:
+            self._load()
+            self.hits += 1
+            count = min(limit, len(self.messages))
+            return [self.messages[-i] for i in range(1, count + 1)]
+
+    def since(self, since_id, limit=HISTORY_PAGE_SIZE):
+        """Public messages newer than since_id, oldest first, or None if
+        more than limit were missed (or some have already been evicted)"""
+        if not self.enabled:
+            return fetch_since(public_messages(), since_id, limit)
+        with self.lock:
+            self._load()
+            if len(self.messages) == self.size and since_id < self.messages[0]['id']:
+                return None
+            newer = [message for message in self.messages if message['id'] > since_id]
+        return newer if len(newer) <= limit else None
+
+    def append(self, message_data):
+        if not self.enabled:
+            return
+        with self.lock:
+            self._load()
+            # Skip a message the initial load already picked up
+            if message_data['id'] > self.loaded_up_to:
+                self.messages.append(message_data)
+
+    def _patch(self, matches, changes):
+        # Entries may be shared with payloads already emitted, so copy them
+        with self.lock:
+            self.messages = deque(
+                (SharedPayload(message, **changes) if matches(message) else message
+                 for message in self.messages),
+                maxlen=self.size)
+
+    def update_sender(self, username, **changes):
+        """Apply a sender's new color or icon to their buffered messages"""
+        if self.enabled:
+            self._patch(lambda message: message['sender'] == username, changes)
+
+    def update_attachment(self, message_id, attachment_data):
+        if self.enabled:
+            self._patch(lambda message: message['id'] == message_id, {'attachment': attachment_data})
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'size': self.size,
+                'buffered': len(self.messages),
+                'hits': self.hits
+            }
+
+recent_messages = RecentMessages(RECENT_MESSAGE_BUFFER_SIZE, enabled=not MESSAGE_QUEUE_URL)
+
+def cleanup_stale_uploads():
+    """Remove chunked uploads that have not been touched for 24 hours"""
     try:
-        cutoff = eastern_now() - timedelta(hours=24)
+        cutoff = utc_now() - timedelta(hours=24)
+        stale_uploads = PendingUpload.query.filter(PendingUpload.last_active < cutoff).all()
+        for upload in stale_uploads:
+            if os.path.exists(upload.partial_path):
+                os.remove(upload.partial_path)
+            db.session.delete(upload)
+        db.session.commit()
+    except Exception as e:
+        app.logger.error(f"Upload cleanup error: {e}")
+        db.session.rollback()
+
+def expire_old_sessions():
+    """Delete sessions older than 24 hours; returns their socket ids"""
+    try:
+        cutoff = utc_now() - timedelta(hours=24)
         old_sessions = Session.query.filter(Session.last_active < cutoff).all()
+        socket_ids = [old_session.socket_id for old_session in old_sessions if old_session.socket_id]
         for old_session in old_sessions:
-            if old_session.socket_id in connected_bears:
-                connected_bears.pop(old_session.socket_id)
             db.session.delete(old_session)
         db.session.commit()
+        return socket_ids
     except Exception as e:
         app.logger.error(f"Session cleanup error: {e}")
         db.session.rollback()
+        return []
+
+def cleanup_old_sessions():
+    """Cleanup sessions older than 24 hours and drop them from the roster.
+
+    Only the database work goes through call_db: the roster and presence
+    broadcaster use green locks and spawn greenlets, so they must be
+    touched from the calling thread, not a native worker.
+    """
+    for socket_id in call_db(expire_old_sessions):
+        departed = connected_bears.pop(socket_id, None)
+        if departed is not None:
+            presence_broadcaster.bear_left(departed['username'])
 
 # Part 2: HTML Template
 HTML_TEMPLATE = '''
@@ -158,32 +1685,18 @@ HTML_TEMPLATE = '''
 <html>
 <head>
     <title>Oh Hello - Forest Friends Chat</title>
-    <link rel="icon" type="image/png" href="https://raw.githubusercontent.com/Bear-Bait/oh-hello/refs/heads/main/favicon.png">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js"></script>
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/tailwindcss/2.2.19/tailwind.min.css" rel="stylesheet">
-    <style>
-        .message-container {
-            height: 600px;
-        }
-        @media (max-width: 768px) {
-            .message-container {
-                height: 400px;
-            }
-        }
-        body {
-            background: linear-gradient(rgba(255,255,255,0.9), rgba(255,255,255,0.9));
-            background-size: cover;
-            background-attachment: fixed;
-        }
-        @keyframes float {
-            0% { transform: translateY(0px) rotate(0deg); }
-            50% { transform: translateY(-20px) rotate(5deg); }
-            100% { transform: translateY(0px) rotate(0deg); }
-        }
-        .animate-float { animation: float 6s ease-in-out infinite; }
-    </style>
+    <link rel="icon" type="image/png" href="{{ assets.favicon }}">
+    {% for href in assets.stylesheets %}
+    <link href="{{ href }}" rel="stylesheet">
+    {% endfor %}
 </head>
-<body class="bg-gray-100">
+<body class="bg-gray-100"
+    {% if current_user %}
+      data-username="{{ current_user.username }}"
+      data-history-page-size="{{ history_page_size }}"
+      data-upload-chunk-size="{{ upload_chunk_size }}"
+      data-wire-schema='{{ wire_schema|tojson }}'
+    {% endif %}>
     <div class="container mx-auto px-4 py-8">
         {% with messages = get_flashed_messages() %}
             {% if messages %}
@@ -205,7 +1718,7 @@ HTML_TEMPLATE = '''
             <div class="flex items-center justify-between relative z-10">
                 <div class="flex items-center gap-4">
                     <div class="relative w-16 h-16">
-                        <img src="https://raw.githubusercontent.com/Bear-Bait/oh-hello/refs/heads/main/120314577.png"
+                        <img src="{{ assets.logo }}"
                              alt="Boris the Bear"
                              class="rounded-full border-4 border-white shadow-lg hover:scale-110 transition-transform duration-300" />
                         <div class="absolute -bottom-2 -right-2 bg-white text-green-800 rounded-full px-3 py-1 text-sm font-bold shadow-lg">Oh!</div>
@@ -236,60 +1749,9 @@ HTML_TEMPLATE = '''
                         <ul id="online-bears" class="space-y-1"></ul>
                     </div>
 
-                    <div class="bg-white/80 rounded-lg p-4 shadow-lg">
-                        <h3 class="font-bold mb-2">Choose Your Forest Color</h3>
-                        <form action="/change_color" method="POST" class="space-y-4">
-                            {% for category, colors in FOREST_COLORS.items() %}
-                            <div class="space-y-2">
-                                <h4 class="font-semibold capitalize">{{ category }}</h4>
-                                {% for color in colors %}
-                                <label class="flex items-center space-x-2 cursor-pointer">
-                                    <input type="radio" name="color_name" value="{{ color.name }}"
-                                        {% if current_user.color_name == color.name %}checked{% endif %}
-                                        class="form-radio">
-                                    <span class="w-4 h-4 rounded-full" style="background-color: {{ color.code }}"></span>
-                                    <span>{{ color.display }}</span>
-                                </label>
-                                {% endfor %}
-                            </div>
-                            {% endfor %}
-                            <button type="submit"
-                                class="w-full bg-green-600 text-white px-4 py-2 rounded hover:bg-green-700">
-                                Update Color
-                            </button>
-                        </form>
-                    </div>
+                    {{ color_picker }}
 
-                    <div class="bg-white/80 rounded-lg p-4 shadow-lg">
-                        <h3 class="font-bold mb-2">Choose Your Forest Creature</h3>
-                        <form action="/change_icon" method="POST" class="space-y-4">
-                            <div class="grid grid-cols-2 gap-2">
-                                {% for icon_id, icon in FOREST_CREATURES.items() %}
-                                <label class="flex flex-col items-center space-y-2 cursor-pointer">
-                                    <input type="radio" name="icon_name" value="{{ icon_id }}"
-                                        {% if current_user.icon_name == icon_id %}checked{% endif %}
-                                        class="hidden peer">
-                                    <div class="relative w-16 h-16 rounded-full overflow-hidden border-4 transition-all duration-300
-                                            peer-checked:border-green-500 hover:border-green-300
-                                            {% if current_user.icon_name == icon_id %}
-                                            border-green-500
-                                            {% else %}
-                                            border-gray-200
-                                            {% endif %}">
-                                        <img src="/media/forest_creatures/{{ icon.file }}"
-                                             alt="{{ icon.display }}"
-                                             class="w-full h-full object-cover">
-                                    </div>
-                                    <span class="text-xs text-center">{{ icon.display }}</span>
-                                </label>
-                                {% endfor %}
-                            </div>
-                            <button type="submit"
-                                class="w-full bg-green-600 text-white px-4 py-2 rounded hover:bg-green-700">
-                                Update Creature
-                            </button>
-                        </form>
-                    </div>
+                    {{ creature_picker }}
                 </div>
 
 <div class="w-3/4">
@@ -348,204 +1810,103 @@ HTML_TEMPLATE = '''
     </div>
 
     {% if current_user %}
-<script>
-    const socket = io();
-    const messages = document.getElementById('messages');
-    const messageForm = document.getElementById('message-form');
-    const messageInput = document.getElementById('message-input');
-    const recipientSelect = document.getElementById('recipient');
-    const bearCounter = document.getElementById('bear-counter');
-    const currentUsername = "{{ current_user.username }}";
-
-    // File attachment elements
-    const attachButton = document.getElementById('attach-button');
-    const fileInput = document.getElementById('file-input');
-    const attachmentPreview = document.getElementById('attachment-preview');
-    const attachmentName = document.getElementById('attachment-name');
-    const removeAttachment = document.getElementById('remove-attachment');
-    let currentAttachmentId = null;
-
-    // File attachment handlers
-    attachButton.addEventListener('click', () => fileInput.click());
-
-    removeAttachment.addEventListener('click', () => {
-        currentAttachmentId = null;
-        attachmentPreview.classList.add('hidden');
-        fileInput.value = '';
-    });
-
-    fileInput.addEventListener('change', async (e) => {
-        const file = e.target.files[0];
-        if (!file) return;
-
-        // Check file size (5MB limit)
-        if (file.size > 25 * 1024 * 1024) {
-            alert('File size must be less than 25MB');
-            fileInput.value = '';
-            return;
-        }
-
-        const formData = new FormData();
-        formData.append('file', file);
-
-        try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
-
-            const result = await response.json();
-
-            if (response.ok) {
-                currentAttachmentId = result.id;
-                attachmentName.textContent = file.name;
-                attachmentPreview.classList.remove('hidden');
-            } else {
-                alert(result.error || 'Upload failed');
-                fileInput.value = '';
-            }
-        } catch (error) {
-            console.error('Upload error:', error);
-            alert('Upload failed');
-            fileInput.value = '';
-        }
-    });
-
-    socket.on('connect', function() {
-        messages.innerHTML = '';
-        socket.emit('request_history');
-    });
-
-    messageForm.onsubmit = function(e) {
-        e.preventDefault();
-        const content = messageInput.value.trim();
-
-        if (content || currentAttachmentId) {
-            socket.emit('message', {
-                content: content,
-                recipient: recipientSelect.value,
-                attachment_id: currentAttachmentId
-            });
-
-            messageInput.value = '';
-            currentAttachmentId = null;
-            attachmentPreview.classList.add('hidden');
-            fileInput.value = '';
-            messageInput.focus();
-        }
-    };
-
-    socket.on('message', function(data) {
-        displayMessage(data);
-    });
-
-    socket.on('message_history', function(messages) {
-        messages.reverse().forEach(message => displayMessage(message));
-    });
-
-    function displayMessage(data) {
-        const div = document.createElement('div');
-        div.className = `message p-3 mb-2 rounded-lg ${data.private ? 'bg-opacity-75' : ''} transition-all duration-300`;
-        div.style.backgroundColor = `${data.color}15`;
-        div.style.borderLeft = `4px solid ${data.color}`;
-
-        const timestamp = new Date(data.timestamp).toLocaleString();
-        const prefix = data.private ? '(Private) ' : '';
-
-
-        let attachmentHTML = '';
-        if (data.attachment) {
-            const { mime_type, url, filename } = data.attachment;
-
-            if (mime_type.startsWith('image/')) {
-                attachmentHTML = `
-                    <div class="ml-10 mt-2">
-                        <a href="${url}" target="_blank">
-                            <img src="${url}" alt="${filename}" class="max-w-md rounded shadow-sm hover:opacity-90 transition-opacity">
-                        </a>
-                    </div>`;
-            } else if (mime_type.startsWith('video/')) {
-                attachmentHTML = `
-                    <div class="ml-10 mt-2">
-                        <video controls class="max-w-md rounded shadow-sm">
-                            <source src="${url}" type="${mime_type}">
-                            Your browser does not support the video tag.
-                        </video>
-                    </div>`;
-            } else {
-                attachmentHTML = `
-                    <div class="ml-10 mt-2">
-                        <a href="${url}" target="_blank"
-                           class="flex items-center gap-2 text-green-600 hover:text-green-700">
-                            ? ${filename}
-                        </a>
-                    </div>`;
-            }
-        }
-
-        div.innerHTML = `
-            <div class="flex items-center gap-2">
-                <img src="${data.icon}" alt="" class="w-8 h-8 rounded-full border-2"
-                     style="border-color: ${data.color}">
-                <div class="font-bold" style="color: ${data.color}">${data.sender}</div>
-            </div>
-            <div class="ml-10 text-gray-800">${prefix}${data.content}</div>
-            ${attachmentHTML}
-            <div class="ml-10 text-xs text-gray-500">${timestamp}</div>
-        `;
-        messages.appendChild(div);
-        messages.scrollTop = messages.scrollHeight;
-    }
-
-    socket.on('bear_update', function(data) {
-        const bearCount = data.count;
-        bearCounter.textContent = `${bearCount} ${bearCount === 1 ? 'Creature' : 'Creatures'} in the Forest`;
-
-        const bearsList = document.getElementById('online-bears');
-        bearsList.innerHTML = data.bears.map(bear => `
-            <li class="flex items-center gap-2 py-1">
-                <img src="${bear.icon}" alt="" class="w-6 h-6 rounded-full">
-                <span class="w-2 h-2 bg-green-500 rounded-full animate-pulse"></span>
-                <span>${bear.username}</span>
-            </li>
-        `).join('');
-
-        recipientSelect.innerHTML = '<option value="">Public Message</option>';
-        data.bears.forEach(bear => {
-            if (bear.username !== currentUsername) {
-                const option = document.createElement('option');
-                option.value = bear.username;
-                option.textContent = `Private to ${bear.username}`;
-                recipientSelect.appendChild(option);
-            }
-        });
-    });
-
-    socket.on('system', function(data) {
-        const div = document.createElement('div');
-        div.className = 'message system p-2 text-gray-500 italic';
-        div.textContent = data.message;
-        messages.appendChild(div);
-        messages.scrollTop = messages.scrollHeight;
-
-        if (data.type === 'forced_logout') {
-            socket.disconnect();
-            window.location.href = '/';
-        }
-    });
-</script>
+    {% for src in assets.scripts %}
+    <script src="{{ src }}"></script>
+    {% endfor %}
     {% endif %}
 </body>
 </html>
 '''
 
 # Basic route handlers
+COLOR_PICKER_TEMPLATE = '''
+<div class="bg-white/80 rounded-lg p-4 shadow-lg">
+    <h3 class="font-bold mb-2">Choose Your Forest Color</h3>
+    <form action="/change_color" method="POST" class="space-y-4">
+        {% for category, colors in FOREST_COLORS.items() %}
+        <div class="space-y-2">
+            <h4 class="font-semibold capitalize">{{ category }}</h4>
+            {% for color in colors %}
+            <label class="flex items-center space-x-2 cursor-pointer">
+                <input type="radio" name="color_name" value="{{ color.name }}"
+                    {% if selected == color.name %}checked{% endif %}
+                    class="form-radio">
+                <span class="w-4 h-4 rounded-full" style="background-color: {{ color.code }}"></span>
+                <span>{{ color.display }}</span>
+            </label>
+            {% endfor %}
+        </div>
+        {% endfor %}
+        <button type="submit"
+            class="w-full bg-green-600 text-white px-4 py-2 rounded hover:bg-green-700">
+            Update Color
+        </button>
+    </form>
+</div>
+'''
+
+CREATURE_PICKER_TEMPLATE = '''
+<div class="bg-white/80 rounded-lg p-4 shadow-lg">
+    <h3 class="font-bold mb-2">Choose Your Forest Creature</h3>
+    <form action="/change_icon" method="POST" class="space-y-4">
+        <div class="grid grid-cols-2 gap-2">
+            {% for icon_id, icon in FOREST_CREATURES.items() %}
+            <label class="flex flex-col items-center space-y-2 cursor-pointer">
+                <input type="radio" name="icon_name" value="{{ icon_id }}"
+                    {% if selected == icon_id %}checked{% endif %}
+                    class="hidden peer">
+                <div class="relative w-16 h-16 rounded-full overflow-hidden border-4 transition-all duration-300
+                        peer-checked:border-green-500 hover:border-green-300
+                        {% if selected == icon_id %}
+                        border-green-500
+                        {% else %}
+                        border-gray-200
+                        {% endif %}">
+                    <img src="{{ creature_icon_url(icon_id) }}"
+                         alt="{{ icon.display }}"
+                         class="w-full h-full object-cover">
+                </div>
+                <span class="text-xs text-center">{{ icon.display }}</span>
+            </label>
+            {% endfor %}
+        </div>
+        <button type="submit"
+            class="w-full bg-green-600 text-white px-4 py-2 rounded hover:bg-green-700">
+            Update Creature
+        </button>
+    </form>
+</div>
+'''
+
+# Compiled once at import; render_template_string re-parses on every call
+INDEX_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+def prerender_picker(source, choices, **context):
+    """Render a picker once per possible selection, keyed by the selected value"""
+    template = app.jinja_env.from_string(source)
+    return {selected: Markup(template.render(selected=selected, **context))
+            for selected in [None, *choices]}
+
+COLOR_PICKERS = prerender_picker(
+    COLOR_PICKER_TEMPLATE,
+    [color['name'] for colors in FOREST_COLORS.values() for color in colors],
+    FOREST_COLORS=FOREST_COLORS)
+CREATURE_PICKERS = prerender_picker(
+    CREATURE_PICKER_TEMPLATE, list(FOREST_CREATURES),
+    FOREST_CREATURES=FOREST_CREATURES, creature_icon_url=creature_icon_url)
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE,
-                                current_user=session.get('user'),
-                                FOREST_COLORS=FOREST_COLORS,
-                                FOREST_CREATURES=FOREST_CREATURES)
+    current_user = session.get('user')
+    selected = current_user or {}
+    return render_template(INDEX_TEMPLATE,
+                           current_user=current_user,
+                           assets=PAGE_ASSETS,
+                           history_page_size=HISTORY_PAGE_SIZE,
+                           upload_chunk_size=UPLOAD_CHUNK_SIZE,
+                           wire_schema=WIRE_SCHEMA,
+                           color_picker=COLOR_PICKERS.get(selected.get('color_name'), COLOR_PICKERS[None]),
+                           creature_picker=CREATURE_PICKERS.get(selected.get('icon_name'), CREATURE_PICKERS[None]))
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -595,7 +1956,7 @@ def login():
             # Terminate existing sessions
             existing_sessions = Session.query.filter_by(user_id=user.id).all()
             for existing_session in existing_sessions:
-                if existing_session.socket_id in connected_bears:
+                if existing_session.socket_id and existing_session.socket_id in connected_bears:
                     # Notify client of forced logout
                     emit('system', {
                         'message': 'You have been logged out due to login from another location',
@@ -603,14 +1964,16 @@ def login():
                     }, room=existing_session.socket_id, namespace='/')
                     # Disconnect socket
                     disconnect(existing_session.socket_id, namespace='/')
-                    connected_bears.pop(existing_session.socket_id, None)
+                    departed = connected_bears.pop(existing_session.socket_id, None)
+                    if departed is not None:
+                        presence_broadcaster.bear_left(departed['username'])
                 db.session.delete(existing_session)
 
             # Create new session
             new_session = Session(
                 session_id=os.urandom(24).hex(),
                 user_id=user.id,
-                last_active=eastern_now()
+                last_active=utc_now()
             )
             db.session.add(new_session)
             db.session.commit()
@@ -619,7 +1982,9 @@ def login():
             session['user'] = {
                 'id': user.id,
                 'username': user.username,
-                'session_id': new_session.session_id
+                'session_id': new_session.session_id,
+                'color_name': user.color_name,
+                'icon_name': user.icon_name
             }
             return redirect(url_for('index'))
 
@@ -643,9 +2008,10 @@ def logout():
             session_id=session['user'].get('session_id')
         ).first()
 
+        departed = None
         if active_session:
-            if active_session.socket_id and active_session.socket_id in connected_bears:
-                connected_bears.pop(active_session.socket_id)
+            if active_session.socket_id:
+                departed = connected_bears.pop(active_session.socket_id, None)
 
             db.session.delete(active_session)
             db.session.commit()
@@ -653,11 +2019,8 @@ def logout():
         session.pop('user', None)
 
         # Update bear count for other users without exit message
-        emit('bear_update', {
-            'bears': [{'username': u['username'], 'icon': u['icon']}
-                     for u in connected_bears.values()],
-            'count': len(connected_bears)
-        }, broadcast=True, namespace='/')
+        if departed is not None:
+            presence_broadcaster.bear_left(departed['username'])
 
     except Exception as e:
         db.session.rollback()
@@ -668,12 +2031,43 @@ def logout():
 # Media serving routes
 @app.route('/media/forest_creatures/<path:filename>')
 def serve_forest_creature(filename):
-    return send_from_directory('media/forest_creatures', filename)
+    # Fingerprinted URLs (see creature_icon_url) can be cached forever
+    return send_cached_file(CREATURE_FOLDER, filename, fingerprint=request.args.get('v'))
 
 @app.route('/attachments/<path:filename>')
 def serve_attachment(filename):
     """Serve uploaded files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_cached_file(app.config['UPLOAD_FOLDER'], filename)
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve built bundles, or the unbuilt sources when there is no build"""
+    if filename in asset_manifest.values():
+        return send_precompressed(ASSET_FOLDER, filename)
+    if filename in ASSET_SOURCES:
+        # Also reached with a build, when the page needs the other wire format
+        directory, name = os.path.split(ASSET_SOURCES[filename])
+        return send_cached_file(directory or '.', name, fingerprint=request.args.get('v'))
+    abort(404)
+
+@app.route('/wire_schema')
+def wire_schema():
+    """The wire format, and the color and icon tables its ids refer to"""
+    return WIRE_SCHEMA
+
+@app.route('/stats')
+def stats():
+    """Operational counters for the real-time layer"""
+    counters = {
+        'presence': presence_broadcaster.stats()
+    }
+    counters['presence_snapshots'] = presence_snapshots.stats()
+    counters['websocket_compression'] = compression_stats.stats()
+    counters['history_buffer'] = recent_messages.stats()
+    counters['profiles'] = user_profiles.stats()
+    if WRITE_BEHIND:
+        counters['message_writer'] = message_writer.stats()
+    return counters
 
 # User customization routes
 @app.route('/change_color', methods=['POST'])
@@ -687,6 +2081,9 @@ def change_color():
         if user:
             user.color_name = color_name
             db.session.commit()
+            session['user'] = {**session['user'], 'color_name': color_name}
+            user_profiles.invalidate(user.id)
+            recent_messages.update_sender(user.username, color=user.color_code)
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while updating color')
@@ -705,6 +2102,9 @@ def change_icon():
             if user:
                 user.icon_name = icon_name
                 db.session.commit()
+                session['user'] = {**session['user'], 'icon_name': icon_name}
+                user_profiles.invalidate(user.id)
+                recent_messages.update_sender(user.username, icon=user.icon_path)
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while updating icon')
@@ -728,27 +2128,25 @@ def upload_file():
         return {'error': 'File type not allowed'}, 400
 
     try:
-        # Generate secure filename and save file
         filename = secure_filename(file.filename)
-        unique_filename = f"{eastern_now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-        # Ensure upload directory exists
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-        # Save the file
-        file.save(file_path)
+        temp_path, digest = save_stream_to_partial(file.stream)
+        try:
+            blob = store_content(temp_path, digest, file_extension(filename))
+        finally:
+            discard_temp_file(temp_path)
 
         # Create file attachment record
         attachment = FileAttachment(
-            filename=unique_filename,
+            filename=blob.filename,
             original_filename=filename,
             mime_type=file.content_type or mimetypes.guess_type(filename)[0],
-            file_size=os.path.getsize(file_path),
-            uploader_id=session['user']['id']
+            file_size=blob.file_size,
+            uploader_id=session['user']['id'],
+            content_hash=blob.sha256
         )
         db.session.add(attachment)
         db.session.commit()
+        schedule_thumbnail(attachment)
 
         return {
             'id': attachment.id,
@@ -761,45 +2159,206 @@ def upload_file():
         db.session.rollback()
         return {'error': str(e)}, 500
 
+# Chunked, resumable upload routes
+def get_pending_upload(upload_id):
+    """Look up one of the current user's in-progress uploads"""
+    return PendingUpload.query.filter_by(id=upload_id, user_id=session['user']['id']).first()
+
+@app.route('/upload/start', methods=['POST'])
+def start_upload():
+    if 'user' not in session:
+        return {'error': 'Unauthorized'}, 401
+
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    total_size = data.get('size')
+
+    if not filename:
+        return {'error': 'No file selected'}, 400
+
+    if not allowed_file(filename):
+        return {'error': 'File type not allowed'}, 400
+
+    if not isinstance(total_size, int) or total_size < 0:
+        return {'error': 'File size required'}, 400
+
+    if total_size > MAX_CONTENT_LENGTH:
+        return {'error': 'File too large'}, 413
+
+    try:
+        upload = PendingUpload(
+            id=os.urandom(16).hex(),
+            user_id=session['user']['id'],
+            filename=filename,
+            mime_type=data.get('mime_type') or mimetypes.guess_type(filename)[0],
+            total_size=total_size
+        )
+
+        os.makedirs(UPLOAD_PARTIAL_FOLDER, exist_ok=True)
+        open(upload.partial_path, 'wb').close()
+
+        db.session.add(upload)
+        db.session.commit()
+        return upload.status(), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return {'error': str(e)}, 500
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Report how many bytes have arrived, so a client can resume"""
+    if 'user' not in session:
+        return {'error': 'Unauthorized'}, 401
+
+    upload = get_pending_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found'}, 404
+
+    return upload.status()
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append one chunk at ?offset=N, verified against X-Chunk-SHA256 if given.
+
+    The body is streamed to disk in small blocks, so a chunk never has to be
+    held in memory. Chunks must arrive in order; a chunk for the wrong offset
+    gets a 409 with the offset the server expects.
+    """
+    if 'user' not in session:
+        return {'error': 'Unauthorized'}, 401
+
+    upload = get_pending_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found'}, 404
+
+    offset = request.args.get('offset', type=int)
+    if offset != upload.received:
+        return dict(upload.status(), error='Unexpected offset'), 409
+
+    length = request.content_length
+    if length is None or length > UPLOAD_CHUNK_SIZE:
+        return {'error': 'Chunk too large'}, 413
+
+    if offset + length > upload.total_size:
+        return {'error': 'Chunk exceeds declared file size'}, 400
+
+    expected_checksum = request.headers.get('X-Chunk-SHA256')
+    checksum = hashlib.sha256()
+    written = 0
+
+    try:
+        with open(upload.partial_path, 'r+b') as partial:
+            # Drop anything left over from an earlier failed attempt
+            partial.seek(offset)
+            partial.truncate()
+
+            while True:
+                block = request.stream.read(UPLOAD_STREAM_BLOCK)
+                if not block:
+                    break
+                partial.write(block)
+                checksum.update(block)
+                written += len(block)
+
+            if written != length or (expected_checksum and
+                                     checksum.hexdigest() != expected_checksum.lower()):
+                partial.seek(offset)
+                partial.truncate()
+                return dict(upload.status(), error='Chunk checksum mismatch'), 400
+
+        upload.received = offset + written
+        upload.last_active = utc_now()
+        db.session.commit()
+        return upload.status()
+
+    except Exception as e:
+        db.session.rollback()
+        return {'error': str(e)}, 500
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    if 'user' not in session:
+        return {'error': 'Unauthorized'}, 401
+
+    upload = get_pending_upload(upload_id)
+    if not upload:
+        return {'error': 'Upload not found'}, 404
+
+    if upload.received != upload.total_size:
+        return dict(upload.status(), error='Upload incomplete'), 409
+
+    try:
+        digest = hash_file(upload.partial_path)
+        blob = store_content(upload.partial_path, digest, file_extension(upload.filename))
+
+        attachment = FileAttachment(
+            filename=blob.filename,
+            original_filename=upload.filename,
+            mime_type=upload.mime_type or 'application/octet-stream',
+            file_size=blob.file_size,
+            uploader_id=upload.user_id,
+            content_hash=blob.sha256
+        )
+        db.session.add(attachment)
+        db.session.delete(upload)
+        db.session.commit()
+        schedule_thumbnail(attachment)
+
+        return {
+            'id': attachment.id,
+            'filename': attachment.original_filename,
+            'mime_type': attachment.mime_type,
+            'file_size': attachment.file_size
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        return {'error': str(e)}, 500
+
    # Socket.IO event handlers
+def attach_socket(user_id, session_id, sid):
+    """Record a new socket on the login session; returns the user's profile,
+    or None if the session has been logged out"""
+    active_session = Session.query.filter_by(user_id=user_id, session_id=session_id).first()
+    if not active_session:
+        return None
+
+    # Update session with socket ID
+    active_session.socket_id = sid
+    active_session.last_active = utc_now()
+    db.session.commit()
+    return user_profiles.get(user_id)
+
 @socketio.on('connect')
 def handle_connect():
     if 'user' not in session:
         return False
 
     try:
-        active_session = Session.query.filter_by(
-            user_id=session['user']['id'],
-            session_id=session['user'].get('session_id')
-        ).first()
-
-        if not active_session:
+        profile = call_db(attach_socket, session['user']['id'],
+                          session['user'].get('session_id'), request.sid)
+        if profile is None:
             session.pop('user', None)
             return False
 
         # Remove any existing connections for this user
-        for sid in list(connected_bears.keys()):
-            if connected_bears[sid]['username'] == session['user']['username']:
-                connected_bears.pop(sid)
-
-        # Update session with socket ID
-        active_session.socket_id = request.sid
-        active_session.last_active = eastern_now()
-        db.session.commit()
+        username = session['user']['username']
+        for sid in connected_bears.sids_for(username):
+            connected_bears.pop(sid, None)
+            leave_room(user_room(username), sid=sid)
 
         # Add user to connected bears
-        user = User.query.get(session['user']['id'])
-        connected_bears[request.sid] = {
-            'username': user.username,
-            'icon': user.icon_path
+        bear = {
+            'username': profile['username'],
+            'icon': profile['icon']
         }
+        connected_bears[request.sid] = bear
+        join_room(user_room(profile['username']))
 
-        # Broadcast updated bear count
-        emit('bear_update', {
-            'bears': [{'username': u['username'], 'icon': u['icon']}
-                     for u in connected_bears.values()],
-            'count': len(connected_bears)
-        }, broadcast=True)
+        # The new client gets the full roster, everyone else just the delta
+        emit('bear_update', presence_snapshots.get())
+        presence_broadcaster.bear_joined(bear_info(bear))
 
         return True
 
@@ -810,59 +2369,119 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     try:
-        if request.sid in connected_bears:
-            connected_bears.pop(request.sid)
-
-            # Only emit the updated user list
-            emit('bear_update', {
-                'bears': [{'username': u['username'], 'icon': u['icon']}
-                         for u in connected_bears.values()],
-                'count': len(connected_bears)
-            }, broadcast=True)
+        departed = connected_bears.pop(request.sid, None)
+        if departed is not None:
+            presence_broadcaster.bear_left(departed['username'])
     except Exception as e:
         app.logger.error(f"Socket disconnect error: {e}")
 
+@socketio.on('request_presence_snapshot')
+def handle_presence_snapshot_request():
+    """Resend the full roster to a client that missed a presence delta"""
+    emit('bear_update', presence_snapshots.get())
+
+def store_message(sender_id, content, recipient_username, attachment_id):
+    """Save a new message and build its payload.
+
+    Returns (sender profile, payload), or None if the sender is unknown.
+    With write-behind enabled the row is only queued here.
+    """
+    # Sender details come from the profile cache, not a User query
+    sender = user_profiles.get(sender_id)
+    if sender is None:
+        return None
+
+    # Only the uploader can attach a file to their message
+    attachment = None
+    if attachment_id:
+        attachment = FileAttachment.query.get(attachment_id)
+        if attachment and attachment.uploader_id != sender['id']:
+            attachment = None
+
+    message = Message(
+        content=content,
+        username=sender['username'],
+        is_private=bool(recipient_username),
+        recipient=recipient_username,
+        color_name=sender['color_name'],
+        sender_id=sender['id'],
+        timestamp=utc_now()
+    )
+
+    if WRITE_BEHIND:
+        message.id = message_writer.next_id()
+        message_data = serialize_message(message, sender, [attachment] if attachment else [])
+        message_writer.submit(message, attachment.id if attachment else None)
+    else:
+        db.session.add(message)
+        db.session.flush()
+        if attachment:
+            attachment.message_id = message.id
+        # Serialize before the commit expires the loaded objects
+        message_data = serialize_message(message, sender, [attachment] if attachment else [])
+        db.session.commit()
+
+    return sender, message_data
+
 @socketio.on('request_history')
-def handle_history_request():
+def handle_history_request(data=None):
+    """Send the latest page of history, or after a reconnect (since_id set)
+    just the messages the client missed.
+
+    Clients treat message_history as a reset. It is also the reply when
+    more than a page was missed, so a long disconnect costs no more than
+    a fresh page load.
+    """
     try:
-        messages = Message.query.order_by(Message.timestamp.desc()).limit(50).all()
-        history = []
-
-        for msg in messages:
-            user = User.query.filter_by(username=msg.username).first()
-            if user:
-                message_data = {
-                    'sender': msg.username,
-                    'content': msg.content,
-                    'timestamp': msg.timestamp.isoformat(),
-                    'private': msg.is_private,
-                    'color': user.color_code,
-                    'icon': user.icon_path
-                }
-
-                # Add attachment info if present
-                if msg.attachments:
-                    attachment = msg.attachments[0]
-                    message_data['attachment'] = {
-                        'filename': attachment.original_filename,
-                        'url': f'/attachments/{attachment.filename}',
-                        'mime_type': attachment.mime_type,
-                        'file_size': attachment.file_size
-                    }
-
-                history.append(message_data)
-
-        emit('message_history', history)
+        viewer = session.get('user')
+        since_id = (data or {}).get('since_id')
+        if since_id is not None:
+            missed = call_db(missed_history, viewer, int(since_id))
+            if missed is not None:
+                emit('missed_messages', missed)
+                return
+        emit('message_history', call_db(latest_history, viewer))
     except Exception as e:
         app.logger.error(f"Error fetching message history: {e}")
 
+@socketio.on('request_older_history')
+def handle_older_history_request(data):
+    try:
+        before_id, before_timestamp, limit = parse_history_cursor(data)
+
+        # Fetch one extra row to tell the client whether to keep scrolling
+        page = call_db(fetch_history, before_id, before_timestamp, limit + 1, viewer=session.get('user'))
+        emit('older_history', {
+            'messages': page[:limit],
+            'has_more': len(page) > limit
+        })
+    except Exception as e:
+        app.logger.error(f"Error fetching older message history: {e}")
+
+@socketio.on('request_conversation')
+def handle_conversation_request(data):
+    """Page through the private messages between the requester and one
+    other user ({'with': username} plus the usual before_* cursor)"""
+    if 'user' not in session:
+        return
+
+    try:
+        other_username = (data or {}).get('with', '').strip()
+        if not other_username:
+            return
+        before_id, before_timestamp, limit = parse_history_cursor(data)
+
+        emit('conversation_history', call_db(fetch_conversation, session['user'], other_username,
+                                             before_id, before_timestamp, limit))
+    except Exception as e:
+        app.logger.error(f"Error fetching conversation history: {e}")
+
 @socketio.on('message')
 def handle_message(data):
     if 'user' not in session:
         return
 
     try:
-        user = User.query.get(session['user']['id'])
         content = data.get('content', '').strip()
         recipient_username = data.get('recipient', '').strip()
         attachment_id = data.get('attachment_id')
@@ -871,61 +2490,37 @@ def handle_message(data):
         if not content and not attachment_id:
             return
 
-        message = Message(
-            content=content,
-            username=user.username,
-            is_private=bool(recipient_username),
-            recipient=recipient_username,
-            color_name=user.color_name,
-            sender_id=user.id
-        )
-        db.session.add(message)
-
-        # Link attachment to message if present
-        if attachment_id:
-            attachment = FileAttachment.query.get(attachment_id)
-            if attachment and attachment.uploader_id == user.id:
-                attachment.message_id = message.id
-
-        db.session.commit()
-
-        message_data = {
-            'sender': user.username,
-            'content': content,
-            'timestamp': message.timestamp.isoformat(),
-            'private': bool(recipient_username),
-            'color': user.color_code,
-            'icon': user.icon_path
-        }
-
-        # Add attachment info if present
-        if attachment_id and message.attachments:
-            attachment = message.attachments[0]
-            message_data['attachment'] = {
-                'filename': attachment.original_filename,
-                'url': f'/attachments/{attachment.filename}',
-                'mime_type': attachment.mime_type,
-                'file_size': attachment.file_size
-            }
+        stored = call_db(store_message, session['user']['id'], content,
+                         recipient_username, attachment_id)
+        if stored is None:
+            return
+        sender, message_data = stored
 
         if recipient_username:
             # Send private message to recipient and sender only
-            for sid, connected_user in connected_bears.items():
-                if connected_user['username'] in [recipient_username, user.username]:
-                    emit('message', message_data, room=sid)
+            emit('message', message_data,
+                 to=[user_room(recipient_username), user_room(sender['username'])])
         else:
-            # Broadcast public message to everyone
+            # Broadcast public message to everyone. It is encoded once here
+            # and the same encoding is reused by every history page it is in
+            message_data = SharedPayload(message_data)
+            recent_messages.append(message_data)
             emit('message', message_data, broadcast=True)
 
     except Exception as e:
         app.logger.error(f"Error handling message: {e}")
         db.session.rollback()
 
- # Application initialization
-if __name__ == '__main__':
+# Application initialization
+def initialize():
+    """Prepare folders, tables and background jobs before serving.
+
+    Called by the __main__ block below and by serve.py.
+    """
     # Ensure media directories exist
     os.makedirs('media/forest_creatures', exist_ok=True)
     os.makedirs('media/attachments', exist_ok=True)
+    os.makedirs(UPLOAD_PARTIAL_FOLDER, exist_ok=True)
 
     with app.app_context():
         try:
@@ -944,10 +2539,13 @@ if __name__ == '__main__':
                 db.session.commit()
                 print("Test user created (username: test, password: test)")
 
+            # Fill the history buffer before the first client asks for it
+            recent_messages.load()
+
             # Define cleanup task here, before scheduling it
             def cleanup_task():
-                with app.app_context():
-                    cleanup_old_sessions()
+                cleanup_old_sessions()
+                call_db(cleanup_stale_uploads)
 
             # Schedule periodic session cleanup
             from apscheduler.schedulers.background import BackgroundScheduler
@@ -955,9 +2553,15 @@ if __name__ == '__main__':
             scheduler.add_job(cleanup_task, 'interval', hours=1)
             scheduler.start()
 
+            if WRITE_BEHIND:
+                signal.signal(signal.SIGTERM, flush_and_exit)
+
         except Exception as e:
             print(f"Error during initialization: {e}")
             raise
 
+if __name__ == '__main__':
+    initialize()
+
     # Start the server
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
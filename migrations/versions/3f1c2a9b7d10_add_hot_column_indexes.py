@@ -0,0 +1,36 @@
+"""add indexes on hot message, session and attachment columns
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-17 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by db.create_all() after the models gained these
+    # indexes already have them, so only create what is missing.
+    op.create_index('ix_message_timestamp_id', 'message',
+                    ['timestamp', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_session_user_id_session_id', 'session',
+                    ['user_id', 'session_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_session_last_active', 'session',
+                    ['last_active'], unique=False, if_not_exists=True)
+    op.create_index('ix_file_attachment_message_id', 'file_attachment',
+                    ['message_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_file_attachment_message_id', table_name='file_attachment', if_exists=True)
+    op.drop_index('ix_session_last_active', table_name='session', if_exists=True)
+    op.drop_index('ix_session_user_id_session_id', table_name='session', if_exists=True)
+    op.drop_index('ix_message_timestamp_id', table_name='message', if_exists=True)
@@ -0,0 +1,39 @@
+"""add pending_upload table for chunked uploads
+
+Revision ID: a7e4c1d9b2f3
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-17 13:40:02.771530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e4c1d9b2f3'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's db.create_all() may already have created it
+    if sa.inspect(op.get_bind()).has_table('pending_upload'):
+        return
+
+    op.create_table('pending_upload',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('mime_type', sa.String(length=127), nullable=True),
+    sa.Column('total_size', sa.Integer(), nullable=False),
+    sa.Column('received', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_active', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('pending_upload')
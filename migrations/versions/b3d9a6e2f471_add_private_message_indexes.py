@@ -0,0 +1,28 @@
+"""add indexes for looking up a user's private messages
+
+Revision ID: b3d9a6e2f471
+Revises: e81b3f27c9d5
+Create Date: 2026-10-17 19:02:37.516840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d9a6e2f471'
+down_revision = 'e81b3f27c9d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_message_recipient_timestamp', 'message',
+                    ['recipient', 'timestamp'], unique=False, if_not_exists=True)
+    op.create_index('ix_message_sender_id_timestamp', 'message',
+                    ['sender_id', 'timestamp'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_message_sender_id_timestamp', table_name='message', if_exists=True)
+    op.drop_index('ix_message_recipient_timestamp', table_name='message', if_exists=True)
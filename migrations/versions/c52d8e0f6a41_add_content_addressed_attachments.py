@@ -0,0 +1,49 @@
+"""add content-addressed attachment store
+
+Revision ID: c52d8e0f6a41
+Revises: a7e4c1d9b2f3
+Create Date: 2026-10-17 15:02:19.408113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d8e0f6a41'
+down_revision = 'a7e4c1d9b2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # The app's db.create_all() may already have created the new table
+    if not inspector.has_table('content_blob'):
+        op.create_table('content_blob',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+        )
+
+    columns = [column['name'] for column in inspector.get_columns('file_attachment')]
+    if 'content_hash' not in columns:
+        with op.batch_alter_table('file_attachment', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key('fk_file_attachment_content_hash',
+                                        'content_blob', ['content_hash'], ['sha256'])
+
+    op.create_index('ix_file_attachment_content_hash', 'file_attachment',
+                    ['content_hash'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_file_attachment_content_hash', table_name='file_attachment', if_exists=True)
+    with op.batch_alter_table('file_attachment', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_file_attachment_content_hash', type_='foreignkey')
+        batch_op.drop_column('content_hash')
+    op.drop_table('content_blob')
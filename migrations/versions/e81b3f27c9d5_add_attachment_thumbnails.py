@@ -0,0 +1,28 @@
+"""add thumbnail filename to file attachments
+
+Revision ID: e81b3f27c9d5
+Revises: c52d8e0f6a41
+Create Date: 2026-10-17 16:25:51.093377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b3f27c9d5'
+down_revision = 'c52d8e0f6a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('file_attachment')]
+    if 'thumbnail_filename' not in columns:
+        with op.batch_alter_table('file_attachment', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('thumbnail_filename', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('file_attachment', schema=None) as batch_op:
+        batch_op.drop_column('thumbnail_filename')
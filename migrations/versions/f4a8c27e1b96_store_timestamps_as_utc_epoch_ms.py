@@ -0,0 +1,171 @@
+"""store timestamps as integer UTC epoch milliseconds
+
+Revision ID: f4a8c27e1b96
+Revises: b3d9a6e2f471
+Create Date: 2026-10-18 09:41:05.227316
+
+"""
+from datetime import datetime, timedelta, timezone
+
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a8c27e1b96'
+down_revision = 'b3d9a6e2f471'
+branch_labels = None
+depends_on = None
+
+# Existing rows hold Eastern wall-clock times, stored as text without an offset
+EASTERN = pytz.timezone('America/New_York')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 5000
+
+# table -> (primary key, timestamp columns)
+TIMESTAMP_COLUMNS = {
+    'message': ('id', ['timestamp']),
+    'session': ('id', ['created_at', 'last_active']),
+    'user': ('id', ['last_seen']),
+    'file_attachment': ('id', ['upload_date']),
+    'content_blob': ('sha256', ['created_at']),
+    'pending_upload': ('id', ['created_at', 'last_active']),
+}
+
+
+def to_epoch_ms(value):
+    # SQLite hands back the stored text, other databases a naive datetime
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (EASTERN.localize(value) - EPOCH) // timedelta(milliseconds=1)
+
+
+def eastern_datetime(value):
+    return (EPOCH + timedelta(milliseconds=value)).astimezone(EASTERN).replace(tzinfo=None)
+
+
+def from_epoch_ms(value):
+    return eastern_datetime(value).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def convert(table_name, key_name, column_name, stored_type, transform):
+    """Rewrite the values of one column that SQLite holds as stored_type,
+    in primary-key batches so no batch holds more than BATCH_SIZE rows"""
+    bind = op.get_bind()
+    table = sa.table(table_name, sa.column(key_name), sa.column(column_name))
+    key, column = table.c[key_name], table.c[column_name]
+    last_key = None
+    while True:
+        query = sa.select(key, column).where(sa.func.typeof(column) == stored_type)
+        if last_key is not None:
+            query = query.where(key > last_key)
+        rows = bind.execute(query.order_by(key).limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        bind.execute(table.update().where(key == sa.bindparam('_key'))
+                     .values({column_name: sa.bindparam('_value')}),
+                     [{'_key': row[0], '_value': transform(row[1])} for row in rows])
+        last_key = rows[-1][0]
+
+
+def swap_column(table_name, key_name, column_name, new_type, transform):
+    """Change the type of one column on a database with typed columns.
+
+    Its values can't be rewritten in place there, so fill a twin column of
+    new_type in primary-key batches, then drop the original (moving its
+    indexes over) and rename the twin into its place. Rows already copied
+    are skipped, so an interrupted upgrade can be run through again.
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    twin_name = f'{column_name}_new'
+    types = {column['name']: column['type'] for column in inspector.get_columns(table_name)}
+    if column_name in types and isinstance(types[column_name], type(new_type)):
+        return
+    if column_name in types:
+        if twin_name not in types:
+            op.add_column(table_name, sa.Column(twin_name, new_type, nullable=True))
+        table = sa.table(table_name, sa.column(key_name), sa.column(column_name),
+                         sa.column(twin_name, new_type))
+        key, column, twin = table.c[key_name], table.c[column_name], table.c[twin_name]
+        last_key = None
+        while True:
+            query = sa.select(key, column).where(column.is_not(None), twin.is_(None))
+            if last_key is not None:
+                query = query.where(key > last_key)
+            rows = bind.execute(query.order_by(key).limit(BATCH_SIZE)).all()
+            if not rows:
+                break
+            bind.execute(table.update().where(key == sa.bindparam('_key'))
+                         .values({twin_name: sa.bindparam('_value')}),
+                         [{'_key': row[0], '_value': transform(row[1])} for row in rows])
+            last_key = rows[-1][0]
+
+        indexes = [index for index in inspector.get_indexes(table_name)
+                   if column_name in index['column_names']]
+        for index in indexes:
+            op.drop_index(index['name'], table_name=table_name)
+        op.drop_column(table_name, column_name)
+    else:
+        indexes = []
+    op.alter_column(table_name, twin_name, new_column_name=column_name, existing_type=new_type)
+    for index in indexes:
+        op.create_index(index['name'], table_name, index['column_names'], unique=index['unique'])
+
+
+def convert_columns(new_type, transform):
+    """swap_column every timestamp column"""
+    inspector = sa.inspect(op.get_bind())
+    for table_name, (key_name, column_names) in TIMESTAMP_COLUMNS.items():
+        if inspector.has_table(table_name):
+            for column_name in column_names:
+                swap_column(table_name, key_name, column_name, new_type, transform)
+
+
+def set_column_types(inspector, new_type, old_type):
+    for table_name, (_, column_names) in TIMESTAMP_COLUMNS.items():
+        if not inspector.has_table(table_name):
+            continue
+        types = {column['name']: column['type'] for column in inspector.get_columns(table_name)}
+        pending = [name for name in column_names
+                   if name in types and not isinstance(types[name], type(new_type))]
+        if pending:
+            with op.batch_alter_table(table_name, schema=None) as batch_op:
+                for name in pending:
+                    batch_op.alter_column(name, existing_type=old_type, type_=new_type)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # SQLite holds any value in any column, so convert the values first
+        # and the column types after: the batch table copy CASTs to the new
+        # type, which would turn '2026-10-17 ...' into 2026. Rows already
+        # holding integers are skipped, so a database created by
+        # db.create_all() or an interrupted upgrade can be run through again.
+        inspector = sa.inspect(bind)
+        for table_name, (key_name, column_names) in TIMESTAMP_COLUMNS.items():
+            if inspector.has_table(table_name):
+                for column_name in column_names:
+                    convert(table_name, key_name, column_name, 'text', to_epoch_ms)
+        set_column_types(inspector, sa.BigInteger(), sa.DateTime())
+    else:
+        convert_columns(sa.BigInteger(), to_epoch_ms)
+
+    op.create_index('ix_pending_upload_last_active', 'pending_upload',
+                    ['last_active'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_pending_upload_last_active', table_name='pending_upload', if_exists=True)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # The reverse order: integers survive the CAST to DATETIME, text would not
+        set_column_types(sa.inspect(bind), sa.DateTime(), sa.BigInteger())
+        for table_name, (key_name, column_names) in TIMESTAMP_COLUMNS.items():
+            for column_name in column_names:
+                convert(table_name, key_name, column_name, 'integer', from_epoch_ms)
+    else:
+        convert_columns(sa.DateTime(), eastern_datetime)
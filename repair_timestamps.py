@@ -0,0 +1,219 @@
+"""Repair stored timestamps in bulk, in place.
+
+Replaces fix_all_times.py. Two kinds of repair:
+
+  --shift-hours -12
+      move every value by a fixed offset, one set-based UPDATE per batch
+      (timestamps are integer epoch milliseconds, so this is plain arithmetic)
+  --from-zone UTC --to-zone America/New_York
+      fix times whose wall clock was written in one zone but stored as if
+      it were in another, honouring daylight saving (what fix_forest_time.py
+      did); rows converted from text by the epoch migration were read as
+      America/New_York
+
+Rows are walked in primary-key order, --batch-size at a time, and each
+batch is committed together with its progress in the timestamp_repair
+table, so the database is only locked for one batch at a time. Running
+the same --name again resumes an interrupted repair where it stopped and
+does nothing once it has finished, so no row is ever shifted twice.
+
+    python repair_timestamps.py --name evening-offset --shift-hours -12 --max-id 52000 --dry-run
+    python repair_timestamps.py --name evening-offset --shift-hours -12 --max-id 52000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+import sqlalchemy as sa
+
+spec = importlib.util.spec_from_file_location(
+    'forest_friends_chat',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forest-friends-chat.py'))
+chat = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat)
+
+app, db = chat.app, chat.db
+
+TIMESTAMP_COLUMNS = {
+    f'{column.table.name}.{column.name}': column for column in (
+        chat.Message.__table__.c.timestamp,
+        chat.Session.__table__.c.created_at,
+        chat.Session.__table__.c.last_active,
+        chat.User.__table__.c.last_seen,
+        chat.FileAttachment.__table__.c.upload_date,
+        chat.ContentBlob.__table__.c.created_at,
+        chat.PendingUpload.__table__.c.created_at,
+        chat.PendingUpload.__table__.c.last_active,
+    )
+}
+
+# One row per named repair: how far it got and whether it finished
+repairs = sa.Table(
+    'timestamp_repair', sa.MetaData(),
+    sa.Column('name', sa.String(100), primary_key=True),
+    sa.Column('spec', sa.Text, nullable=False),
+    sa.Column('last_key', sa.Text, nullable=True),
+    sa.Column('rows_done', sa.Integer, nullable=False, default=0),
+    sa.Column('finished', sa.Boolean, nullable=False, default=False),
+)
+
+
+def rezoned(value, from_zone, to_zone):
+    """The instant whose from_zone wall clock reads what value shows in to_zone"""
+    return from_zone.localize(value.astimezone(to_zone).replace(tzinfo=None))
+
+
+class Repair:
+    def __init__(self, args):
+        self.column = TIMESTAMP_COLUMNS[args.column]
+        self.table = self.column.table
+        self.key = list(self.table.primary_key.columns)[0]
+        self.batch_size = args.batch_size
+        self.shift_ms = round(args.shift_hours * 3600 * 1000) if args.shift_hours is not None else None
+        self.from_zone = pytz.timezone(args.from_zone) if args.from_zone else None
+        self.to_zone = pytz.timezone(args.to_zone) if args.to_zone else None
+        self.conditions = [self.column.isnot(None)]
+        if args.min_id is not None:
+            self.conditions.append(self.key >= args.min_id)
+        if args.max_id is not None:
+            self.conditions.append(self.key <= args.max_id)
+        if args.before:
+            before = datetime.fromisoformat(args.before)
+            if before.tzinfo is None:
+                before = chat.LOCAL_TIMEZONE.localize(before)
+            self.conditions.append(self.column < before)
+        self.spec = json.dumps({
+            'column': args.column, 'shift_hours': args.shift_hours,
+            'from_zone': args.from_zone, 'to_zone': args.to_zone,
+            'min_id': args.min_id, 'max_id': args.max_id, 'before': args.before
+        }, sort_keys=True)
+
+    def remaining(self, last_key):
+        conditions = list(self.conditions)
+        if last_key is not None:
+            conditions.append(self.key > last_key)
+        return conditions
+
+    def convert(self, value):
+        if self.shift_ms is not None:
+            return value + timedelta(milliseconds=self.shift_ms)
+        return rezoned(value, self.from_zone, self.to_zone)
+
+    def next_batch(self, conn, last_key):
+        """Apply one batch; returns (rows changed, last key) or None when done"""
+        conditions = self.remaining(last_key)
+        if self.shift_ms is not None:
+            if self.batch_size:
+                keys = (sa.select(self.key).where(*conditions)
+                        .order_by(self.key).limit(self.batch_size).subquery())
+                upper = conn.execute(sa.select(sa.func.max(keys.c[self.key.name]))).scalar()
+                if upper is None:
+                    return None
+                conditions.append(self.key <= upper)
+            else:
+                upper = conn.execute(sa.select(sa.func.max(self.key)).where(*conditions)).scalar()
+                if upper is None:
+                    return None
+            result = conn.execute(self.table.update().where(*conditions).values(
+                {self.column.name: sa.type_coerce(self.column, sa.BigInteger) + self.shift_ms}))
+            return result.rowcount, upper
+
+        rows = conn.execute(sa.select(self.key, self.column).where(*conditions)
+                            .order_by(self.key).limit(self.batch_size or None)).all()
+        if not rows:
+            return None
+        conn.execute(
+            self.table.update().where(self.key == sa.bindparam('_key'))
+            .values({self.column.name: sa.bindparam('_value')}),
+            [{'_key': key, '_value': self.convert(value)} for key, value in rows])
+        return len(rows), rows[-1][0]
+
+    def preview(self, conn, last_key, count=5):
+        rows = conn.execute(sa.select(self.key, self.column).where(*self.remaining(last_key))
+                            .order_by(self.key).limit(count)).all()
+        for key, value in rows:
+            print(f"  {self.key.name} {key}: {chat.local_time(value)} -> {chat.local_time(self.convert(value))}")
+
+
+def run(repair, name, dry_run, pause):
+    repairs.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        state = conn.execute(sa.select(repairs).where(repairs.c.name == name)).first()
+    if state is not None and state.spec != repair.spec:
+        sys.exit(f"Repair '{name}' was started with different options: {state.spec}")
+    if state is not None and state.finished:
+        print(f"Repair '{name}' already finished ({state.rows_done} rows); nothing to do")
+        return
+    last_key = json.loads(state.last_key) if state is not None and state.last_key else None
+    rows_done = state.rows_done if state is not None else 0
+
+    with db.engine.connect() as conn:
+        total = conn.execute(sa.select(sa.func.count()).select_from(repair.table)
+                             .where(*repair.remaining(last_key))).scalar()
+        if dry_run:
+            print(f"Would update {total} rows of {repair.column}, for example:")
+            repair.preview(conn, last_key)
+            return
+
+    if state is None:
+        with db.engine.begin() as conn:
+            conn.execute(repairs.insert().values(name=name, spec=repair.spec, rows_done=0, finished=False))
+    elif last_key is not None:
+        print(f"Resuming '{name}' after {repair.key.name} {last_key} ({rows_done} rows already done)")
+
+    start = time.perf_counter()
+    done = 0
+    while True:
+        # The batch and its progress commit together, so a crash between
+        # batches never leaves rows shifted but unrecorded
+        with db.engine.begin() as conn:
+            batch = repair.next_batch(conn, last_key)
+            if batch is None:
+                conn.execute(repairs.update().where(repairs.c.name == name).values(finished=True))
+                break
+            changed, last_key = batch
+            done += changed
+            conn.execute(repairs.update().where(repairs.c.name == name).values(
+                last_key=json.dumps(last_key), rows_done=rows_done + done))
+        elapsed = time.perf_counter() - start
+        print(f"  {done}/{total} rows, up to {repair.key.name} {last_key} "
+              f"({done / elapsed if elapsed else 0:.0f} rows/s)")
+        if pause:
+            time.sleep(pause)
+
+    print(f"Repair '{name}' finished: {rows_done + done} rows of {repair.column} updated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shift or re-zone stored timestamps in resumable batches')
+    parser.add_argument('--name', required=True,
+                        help='identifies the repair; re-running a name resumes it or does nothing once finished')
+    parser.add_argument('--column', choices=sorted(TIMESTAMP_COLUMNS), default='message.timestamp')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--shift-hours', type=float, help='add this many hours (negative to go back)')
+    mode.add_argument('--from-zone', help='zone the wall-clock times were really written in')
+    parser.add_argument('--to-zone', help='zone they were stored as (with --from-zone)')
+    parser.add_argument('--min-id', type=int, help='only rows with this primary key or above')
+    parser.add_argument('--max-id', type=int, help='only rows with this primary key or below')
+    parser.add_argument('--before', help='only rows earlier than this ISO time (local time if no offset)')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='rows per transaction; 0 updates the whole range at once')
+    parser.add_argument('--pause', type=float, default=0, help='seconds to wait between batches')
+    parser.add_argument('--dry-run', action='store_true', help='count and preview the rows without changing them')
+    args = parser.parse_args()
+    if args.from_zone and not args.to_zone:
+        parser.error('--from-zone needs --to-zone')
+    if args.from_zone and args.batch_size == 0:
+        parser.error('--batch-size 0 is only supported with --shift-hours')
+
+    with app.app_context():
+        run(Repair(args), args.name, args.dry_run, args.pause)
+
+
+if __name__ == '__main__':
+    main()
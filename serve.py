@@ -0,0 +1,55 @@
+"""Run the chat server on a cooperative (eventlet or gevent) worker.
+
+The standard library is monkey-patched before the app is imported, so one
+process can hold thousands of idle sockets on green threads; database work
+is handed to a native thread pool (see call_db in forest-friends-chat.py).
+Needs `pip install eventlet` or `pip install gevent gevent-websocket`.
+
+    python serve.py [--mode eventlet|gevent|threading] [--host H] [--port P]
+"""
+import argparse
+import importlib.util
+import os
+
+MODES = ('eventlet', 'gevent', 'threading')
+
+
+def default_mode():
+    """The first cooperative library that is installed"""
+    for mode in MODES[:2]:
+        if importlib.util.find_spec(mode) is not None:
+            return mode
+    return 'threading'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Forest Friends Chat')
+    parser.add_argument('--mode', choices=MODES, default=default_mode(),
+                        help='async worker (default: eventlet or gevent, whichever is installed)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    # Patch before anything imports socket, threading or time
+    if args.mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif args.mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    os.environ['FOREST_ASYNC_MODE'] = args.mode
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(root, 'forest-friends-chat.py'))
+    chat = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(chat)
+
+    chat.initialize()
+    print(f"Serving on {args.host}:{args.port} ({args.mode})")
+    chat.socketio.run(chat.app, host=args.host, port=args.port, debug=False,
+                      use_reloader=False, log_output=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == '__main__':
+    main()
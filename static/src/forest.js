@@ -0,0 +1,412 @@
+const socket = io();
+const messages = document.getElementById('messages');
+const messageForm = document.getElementById('message-form');
+const messageInput = document.getElementById('message-input');
+const recipientSelect = document.getElementById('recipient');
+const bearCounter = document.getElementById('bear-counter');
+// Per-page values are passed from the template as data attributes on <body>
+const currentUsername = document.body.dataset.username;
+const HISTORY_PAGE_SIZE = Number(document.body.dataset.historyPageSize);
+// With the msgpack wire format, colors and creature icons arrive as ids into these tables
+const WIRE_SCHEMA = JSON.parse(document.body.dataset.wireSchema);
+
+function fromWire(item) {
+    if (typeof item.color === 'number') item.color = WIRE_SCHEMA.colors[item.color];
+    if (typeof item.icon === 'number') item.icon = WIRE_SCHEMA.icons[item.icon];
+    return item;
+}
+
+// File attachment elements
+const attachButton = document.getElementById('attach-button');
+const fileInput = document.getElementById('file-input');
+const attachmentPreview = document.getElementById('attachment-preview');
+const attachmentName = document.getElementById('attachment-name');
+const removeAttachment = document.getElementById('remove-attachment');
+let currentAttachmentId = null;
+
+// Cursor for loading older history pages
+let oldestMessage = null;
+let hasMoreHistory = false;
+let loadingHistory = false;
+
+// Ids of the messages on screen; the newest one is sent on reconnect so the
+// server only replays what was missed
+let seenMessageIds = new Set();
+let newestMessageId = null;
+
+// While a bear is picked as the recipient, the private conversation with
+// them is shown instead of the forest feed
+let conversationWith = null;
+
+// File attachment handlers
+attachButton.addEventListener('click', () => fileInput.click());
+
+removeAttachment.addEventListener('click', () => {
+    currentAttachmentId = null;
+    attachmentPreview.classList.add('hidden');
+    fileInput.value = '';
+});
+
+fileInput.addEventListener('change', async (e) => {
+    const file = e.target.files[0];
+    if (!file) return;
+
+    // Check file size (5MB limit)
+    if (file.size > 25 * 1024 * 1024) {
+        alert('File size must be less than 25MB');
+        fileInput.value = '';
+        return;
+    }
+
+    try {
+        const result = await uploadFile(file);
+        currentAttachmentId = result.id;
+        attachmentName.textContent = file.name;
+        attachmentPreview.classList.remove('hidden');
+    } catch (error) {
+        console.error('Upload error:', error);
+        alert(error.message || 'Upload failed');
+        fileInput.value = '';
+    }
+});
+
+// Chunked, resumable upload: failed chunks are retried from the last
+// offset the server confirmed instead of restarting the whole file.
+const UPLOAD_CHUNK_SIZE = Number(document.body.dataset.uploadChunkSize);
+
+async function sha256Hex(buffer) {
+    // crypto.subtle only exists on secure origins; the server treats
+    // the checksum header as optional.
+    if (!(window.crypto && window.crypto.subtle)) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadJSON(url, options) {
+    const response = await fetch(url, options);
+    const result = await response.json();
+    return { response, result };
+}
+
+async function uploadFile(file) {
+    let { response, result } = await uploadJSON('/upload/start', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, mime_type: file.type })
+    });
+    if (!response.ok) throw new Error(result.error || 'Upload failed');
+
+    const uploadId = result.upload_id;
+    let offset = result.received;
+    let failures = 0;
+
+    while (offset < file.size) {
+        let fatalError = null;
+        try {
+            const body = await file.slice(offset, offset + UPLOAD_CHUNK_SIZE).arrayBuffer();
+            const headers = { 'Content-Type': 'application/octet-stream' };
+            const checksum = await sha256Hex(body);
+            if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+            ({ response, result } = await uploadJSON(`/upload/${uploadId}?offset=${offset}`, {
+                method: 'PUT', headers, body
+            }));
+            if (response.ok || response.status === 409) {
+                // 409 means the server expects a different offset
+                offset = result.received;
+                failures = 0;
+                continue;
+            }
+            if (response.status !== 400) {
+                fatalError = new Error(result.error || 'Upload failed');
+            }
+        } catch (error) {
+            // Network error: retry below
+        }
+        if (fatalError) throw fatalError;
+
+        // Back off, then ask the server where to resume from
+        failures += 1;
+        if (failures > 5) throw new Error('Upload failed');
+        await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+        try {
+            ({ response, result } = await uploadJSON(`/upload/${uploadId}`));
+            if (response.ok) offset = result.received;
+        } catch (error) {
+            // Still offline; the next attempt will try again
+        }
+    }
+
+    ({ response, result } = await uploadJSON(`/upload/${uploadId}/finalize`, { method: 'POST' }));
+    if (!response.ok) throw new Error(result.error || 'Upload failed');
+    return result;
+}
+
+socket.on('connect', function() {
+    presenceVersion = null;
+    loadingHistory = false;
+    if (conversationWith !== null) {
+        socket.emit('request_conversation', { with: conversationWith });
+    } else if (newestMessageId === null) {
+        socket.emit('request_history');
+    } else {
+        socket.emit('request_history', { since_id: newestMessageId });
+    }
+});
+
+messageForm.onsubmit = function(e) {
+    e.preventDefault();
+    const content = messageInput.value.trim();
+
+    if (content || currentAttachmentId) {
+        socket.emit('message', {
+            content: content,
+            recipient: recipientSelect.value,
+            attachment_id: currentAttachmentId
+        });
+
+        messageInput.value = '';
+        currentAttachmentId = null;
+        attachmentPreview.classList.add('hidden');
+        fileInput.value = '';
+        messageInput.focus();
+    }
+};
+
+// Whether a live message belongs in the current view
+function inView(data) {
+    if (conversationWith === null) return true;
+    return data.private && (data.sender === conversationWith ||
+        (data.sender === currentUsername && data.recipient === conversationWith));
+}
+
+socket.on('message', function(data) {
+    if (inView(data)) displayMessage(data);
+});
+
+// A full page of history, newest first, replaces whatever is on screen
+function showHistory(history, hasMore) {
+    messages.innerHTML = '';
+    seenMessageIds = new Set();
+    newestMessageId = null;
+    oldestMessage = null;
+    if (history.length) {
+        oldestMessage = history[history.length - 1];
+    }
+    hasMoreHistory = hasMore;
+    history.reverse().forEach(message => displayMessage(message));
+}
+
+socket.on('message_history', function(history) {
+    if (conversationWith !== null) return;  // asked for before a recipient was picked
+    showHistory(history, history.length >= HISTORY_PAGE_SIZE);
+});
+
+// Messages sent while we were reconnecting, oldest first
+socket.on('missed_messages', function(missed) {
+    missed.filter(inView).forEach(message => displayMessage(message));
+});
+
+// Picking a recipient switches to that conversation; "Public Message" back to the feed
+function showConversation(username) {
+    conversationWith = username;
+    loadingHistory = false;
+    if (username === null) {
+        socket.emit('request_history');
+    } else {
+        socket.emit('request_conversation', { with: username });
+    }
+}
+
+recipientSelect.addEventListener('change', () => showConversation(recipientSelect.value || null));
+
+// Load older pages when scrolled to the top
+messages.addEventListener('scroll', function() {
+    if (messages.scrollTop > 50 || !hasMoreHistory || loadingHistory || !oldestMessage) return;
+    loadingHistory = true;
+    const cursor = {
+        before_id: oldestMessage.id,
+        before_timestamp: oldestMessage.timestamp
+    };
+    if (conversationWith !== null) {
+        socket.emit('request_conversation', { with: conversationWith, ...cursor });
+    } else {
+        socket.emit('request_older_history', cursor);
+    }
+});
+
+socket.on('older_history', function(data) {
+    if (conversationWith !== null) return;
+    showOlder(data);
+});
+
+// The first page of a conversation, or an older one while scrolling up
+socket.on('conversation_history', function(data) {
+    if (data.with !== conversationWith) return;  // the view changed since it was asked for
+    if (loadingHistory) {
+        showOlder(data);
+    } else {
+        showHistory(data.messages, data.has_more);
+    }
+});
+
+function showOlder(data) {
+    loadingHistory = false;
+    hasMoreHistory = data.has_more;
+    if (!data.messages.length) return;
+
+    // Keep the current view in place while older messages are prepended
+    const previousHeight = messages.scrollHeight;
+    const previousTop = messages.scrollTop;
+    data.messages.forEach(message => displayMessage(message, true));
+    oldestMessage = data.messages[data.messages.length - 1];
+    messages.scrollTop = messages.scrollHeight - previousHeight + previousTop;
+}
+
+function displayMessage(data, prepend = false) {
+    // A message can arrive live and again in a reconnect replay
+    if (seenMessageIds.has(data.id)) return;
+    seenMessageIds.add(data.id);
+    if (!prepend && (newestMessageId === null || data.id > newestMessageId)) {
+        newestMessageId = data.id;
+    }
+    fromWire(data);
+
+    const div = document.createElement('div');
+    div.className = `message p-3 mb-2 rounded-lg ${data.private ? 'bg-opacity-75' : ''} transition-all duration-300`;
+    div.style.backgroundColor = `${data.color}15`;
+    div.style.borderLeft = `4px solid ${data.color}`;
+
+    const timestamp = new Date(data.timestamp).toLocaleString();
+    const prefix = data.private ? '(Private) ' : '';
+
+
+    let attachmentHTML = '';
+    if (data.attachment) {
+        const { mime_type, url, filename, thumbnail_url } = data.attachment;
+
+        if (mime_type.startsWith('image/')) {
+            // Show the thumbnail inline; the link opens the original
+            attachmentHTML = `
+                <div class="ml-10 mt-2">
+                    <a href="${url}" target="_blank">
+                        <img src="${thumbnail_url || url}" alt="${filename}" loading="lazy" class="max-w-md rounded shadow-sm hover:opacity-90 transition-opacity">
+                    </a>
+                </div>`;
+        } else if (mime_type.startsWith('video/')) {
+            // With a poster frame, nothing is downloaded until play
+            const poster = thumbnail_url ? `poster="${thumbnail_url}" preload="none"` : 'preload="metadata"';
+            attachmentHTML = `
+                <div class="ml-10 mt-2">
+                    <video controls ${poster} class="max-w-md rounded shadow-sm">
+                        <source src="${url}" type="${mime_type}">
+                        Your browser does not support the video tag.
+                    </video>
+                </div>`;
+        } else {
+            attachmentHTML = `
+                <div class="ml-10 mt-2">
+                    <a href="${url}" target="_blank"
+                       class="flex items-center gap-2 text-green-600 hover:text-green-700">
+                        ? ${filename}
+                    </a>
+                </div>`;
+        }
+    }
+
+    div.innerHTML = `
+        <div class="flex items-center gap-2">
+            <img src="${data.icon}" alt="" class="w-8 h-8 rounded-full border-2"
+                 style="border-color: ${data.color}">
+            <div class="font-bold" style="color: ${data.color}">${data.sender}</div>
+        </div>
+        <div class="ml-10 text-gray-800">${prefix}${data.content}</div>
+        ${attachmentHTML}
+        <div class="ml-10 text-xs text-gray-500">${timestamp}</div>
+    `;
+    if (prepend) {
+        messages.insertBefore(div, messages.firstChild);
+    } else {
+        messages.appendChild(div);
+        messages.scrollTop = messages.scrollHeight;
+    }
+}
+
+// Online roster, kept in sync from bear_delta broadcasts.
+// presenceVersion is null until a full bear_update snapshot arrives.
+let roster = new Map();
+let presenceVersion = null;
+
+function renderRoster() {
+    const bears = Array.from(roster.values());
+    const bearCount = bears.length;
+    bearCounter.textContent = `${bearCount} ${bearCount === 1 ? 'Creature' : 'Creatures'} in the Forest`;
+
+    const bearsList = document.getElementById('online-bears');
+    bearsList.innerHTML = bears.map(bear => `
+        <li class="flex items-center gap-2 py-1">
+            <img src="${bear.icon}" alt="" class="w-6 h-6 rounded-full">
+            <span class="w-2 h-2 bg-green-500 rounded-full animate-pulse"></span>
+            <span>${bear.username}</span>
+        </li>
+    `).join('');
+
+    const selected = recipientSelect.value;
+    recipientSelect.innerHTML = '<option value="">Public Message</option>';
+    bears.forEach(bear => {
+        if (bear.username !== currentUsername) {
+            const option = document.createElement('option');
+            option.value = bear.username;
+            option.textContent = `Private to ${bear.username}`;
+            recipientSelect.appendChild(option);
+        }
+    });
+    if (roster.has(selected)) {
+        recipientSelect.value = selected;
+    }
+    if (conversationWith !== null && !roster.has(conversationWith)) {
+        // The other bear left, so the next message would go to everyone
+        showConversation(null);
+    }
+}
+
+socket.on('bear_update', function(data) {
+    roster = new Map(data.bears.map(bear => [bear.username, fromWire(bear)]));
+    presenceVersion = data.version;
+    renderRoster();
+});
+
+function applyPresenceDelta(data, change) {
+    if (presenceVersion === null || data.version <= presenceVersion) {
+        return;  // waiting for a snapshot, or already reflected in it
+    }
+    if (data.version !== presenceVersion + 1) {
+        // Missed a delta: fall back to a full snapshot
+        presenceVersion = null;
+        socket.emit('request_presence_snapshot');
+        return;
+    }
+    change();
+    presenceVersion = data.version;
+    renderRoster();
+}
+
+socket.on('bear_delta', function(data) {
+    applyPresenceDelta(data, () => {
+        data.left.forEach(username => roster.delete(username));
+        data.joined.forEach(bear => roster.set(bear.username, fromWire(bear)));
+    });
+});
+
+socket.on('system', function(data) {
+    const div = document.createElement('div');
+    div.className = 'message system p-2 text-gray-500 italic';
+    div.textContent = data.message;
+    messages.appendChild(div);
+    messages.scrollTop = messages.scrollHeight;
+
+    if (data.type === 'forced_logout') {
+        socket.disconnect();
+        window.location.href = '/';
+    }
+});
@@ -0,0 +1,29 @@
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def chat(tmp_path_factory):
+    """The app module, loaded once against a throwaway SQLite database"""
+    os.environ['FOREST_DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'chat.db'}"
+    spec = importlib.util.spec_from_file_location(
+        'forest_friends_chat', os.path.join(ROOT, 'forest-friends-chat.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.app.config['TESTING'] = True
+    return module
+
+
+@pytest.fixture
+def db(chat):
+    """Empty tables and caches for each test, inside an app context"""
+    with chat.app.app_context():
+        chat.db.drop_all()
+        chat.db.create_all()
+        chat.user_profiles.profiles.clear()
+        yield chat.db
+        chat.db.session.remove()
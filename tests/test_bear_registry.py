@@ -0,0 +1,62 @@
+"""connected_bears behaves the same in one process and backed by Redis"""
+import pytest
+
+
+@pytest.fixture(params=['local', 'redis'])
+def registry(request, chat):
+    if request.param == 'local':
+        return chat.LocalBearRegistry()
+    fakeredis = pytest.importorskip('fakeredis')
+    return chat.RedisBearRegistry(None, client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def bear(username):
+    return {'username': username, 'icon': f'/media/forest_creatures/{username}.png'}
+
+
+def test_set_get_and_delete(registry):
+    registry['sid1'] = bear('alice')
+    assert registry['sid1'] == bear('alice')
+    assert 'sid1' in registry
+    assert len(registry) == 1
+
+    del registry['sid1']
+    assert 'sid1' not in registry
+    with pytest.raises(KeyError):
+        registry['sid1']
+    with pytest.raises(KeyError):
+        del registry['sid1']
+
+
+def test_pop_with_default(registry):
+    registry['sid1'] = bear('alice')
+    assert registry.pop('sid1', None) == bear('alice')
+    assert registry.pop('sid1', None) is None
+    assert registry.sids_for('alice') == []
+
+
+def test_items_and_values(registry):
+    registry['sid1'] = bear('alice')
+    registry['sid2'] = bear('bob')
+    assert sorted(registry) == ['sid1', 'sid2']
+    assert sorted(registry.items()) == [('sid1', bear('alice')), ('sid2', bear('bob'))]
+    assert sorted(value['username'] for value in registry.values()) == ['alice', 'bob']
+
+
+def test_sids_for_indexes_each_users_sockets(registry):
+    registry['sid1'] = bear('alice')
+    registry['sid2'] = bear('alice')
+    registry['sid3'] = bear('bob')
+    assert sorted(registry.sids_for('alice')) == ['sid1', 'sid2']
+    assert registry.sids_for('bob') == ['sid3']
+    assert registry.sids_for('carol') == []
+
+    del registry['sid1']
+    assert registry.sids_for('alice') == ['sid2']
+
+
+def test_next_version_counts_up(registry):
+    assert registry.version == 0
+    assert registry.next_version() == 1
+    assert registry.next_version() == 2
+    assert registry.version == 2
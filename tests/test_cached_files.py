@@ -0,0 +1,60 @@
+"""ETags, conditional requests, ranges and cache lifetimes for served files"""
+import hashlib
+
+import pytest
+
+CONTENT = b'forest friends attachment bytes'
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def client(chat, tmp_path, monkeypatch):
+    monkeypatch.setitem(chat.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    (tmp_path / f'{DIGEST}.txt').write_bytes(CONTENT)
+    (tmp_path / 'notes.txt').write_bytes(CONTENT)
+    return chat.app.test_client()
+
+
+def test_content_addressed_name_is_strong_etag_and_immutable(chat, client):
+    response = client.get(f'/attachments/{DIGEST}.txt')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{DIGEST}"'
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == chat.IMMUTABLE_MAX_AGE
+
+
+def test_other_names_get_a_content_etag_and_revalidate(chat, client):
+    response = client.get('/attachments/notes.txt')
+    assert response.headers['ETag'] == f'"{DIGEST}"'
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age == chat.REVALIDATE_MAX_AGE
+
+
+def test_if_none_match_returns_304(client):
+    response = client.get(f'/attachments/{DIGEST}.txt', headers={'If-None-Match': f'"{DIGEST}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_range_returns_206(client):
+    response = client.get('/attachments/notes.txt', headers={'Range': 'bytes=0-5'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[:6]
+    assert response.headers['Content-Range'] == f'bytes 0-5/{len(CONTENT)}'
+
+
+def test_matching_fingerprint_is_immutable(chat):
+    client = chat.app.test_client()
+    url = chat.creature_icon_url('bear')
+    assert '?v=' in url
+    assert client.get(url).cache_control.immutable
+    stale = url.split('?v=')[0] + '?v=000000000000'
+    assert not client.get(stale).cache_control.immutable
+
+
+@pytest.mark.parametrize('path', [
+    '/attachments/..%2Fforest-friends-chat.py',
+    '/media/forest_creatures/..%2F..%2Fforest-friends-chat.py',
+])
+def test_traversal_is_404(client, path):
+    assert client.get(path).status_code == 404
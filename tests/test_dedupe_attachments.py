@@ -0,0 +1,79 @@
+"""dedupe_attachments.py never removes a file a committed row points at"""
+import hashlib
+import importlib.util
+import os
+
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.fixture
+def dedupe(chat, db, tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location(
+        'dedupe_attachments', os.path.join(ROOT, 'dedupe_attachments.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Run against the test app rather than the copy the script loads
+    for name, value in (('chat', chat), ('app', chat.app), ('db', chat.db),
+                        ('ContentBlob', chat.ContentBlob), ('FileAttachment', chat.FileAttachment)):
+        monkeypatch.setattr(module, name, value)
+    monkeypatch.setitem(chat.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return module
+
+
+@pytest.fixture
+def legacy_attachments(chat, db, tmp_path):
+    """Three timestamp-named uploads, two of them byte-identical"""
+    user = chat.User(username='alice', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    contents = {'1_a.png': b'acorn', '2_b.png': b'acorn', '3_c.png': b'berry'}
+    for filename, data in contents.items():
+        (tmp_path / filename).write_bytes(data)
+        db.session.add(chat.FileAttachment(filename=filename, original_filename=filename, mime_type='image/png',
+                                           file_size=len(data), uploader_id=user.id))
+    db.session.commit()
+    return contents
+
+
+def attachment_files(chat, db, tmp_path):
+    db.session.expire_all()
+    return {attachment.filename: (tmp_path / attachment.filename).exists()
+            for attachment in chat.FileAttachment.query.order_by(chat.FileAttachment.id)}
+
+
+def test_failed_commit_leaves_every_row_pointing_at_a_file(chat, db, dedupe, legacy_attachments,
+                                                           tmp_path, monkeypatch):
+    def failing_commit():
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    with pytest.raises(RuntimeError):
+        dedupe.dedupe(batch_size=10, dry_run=False)
+    monkeypatch.undo()
+
+    monkeypatch.setitem(chat.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    assert attachment_files(chat, db, tmp_path) == {filename: True for filename in legacy_attachments}
+    assert chat.ContentBlob.query.count() == 0
+
+
+def test_rerun_after_a_failed_commit_finishes_the_store(chat, db, dedupe, legacy_attachments,
+                                                       tmp_path, monkeypatch):
+    def failing_commit():
+        raise RuntimeError('disk I/O error')
+
+    with monkeypatch.context() as failing:
+        failing.setattr(db.session, 'commit', failing_commit)
+        with pytest.raises(RuntimeError):
+            dedupe.dedupe(batch_size=10, dry_run=False)
+
+    stats = dedupe.dedupe(batch_size=10, dry_run=False)
+    assert stats['duplicates'] == 1
+
+    acorn = hashlib.sha256(b'acorn').hexdigest()
+    berry = hashlib.sha256(b'berry').hexdigest()
+    assert attachment_files(chat, db, tmp_path) == {f'{acorn}.png': True, f'{berry}.png': True}
+    assert sorted(os.listdir(tmp_path)) == sorted([f'{acorn}.png', f'{berry}.png'])
+    assert db.session.get(chat.ContentBlob, acorn).ref_count == 2
+    assert db.session.get(chat.ContentBlob, berry).ref_count == 1
@@ -0,0 +1,72 @@
+"""History pages cost a fixed number of queries, whatever their size"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def forest(chat, db):
+    """Ten users with public messages, DMs and attachments between them"""
+    users = [chat.User(username=f'bear{i}', password_hash='x') for i in range(10)]
+    db.session.add_all(users)
+    db.session.flush()
+    for i in range(150):
+        sender, recipient = users[i % 10], users[(i + 1) % 10]
+        private = i % 3 == 0
+        message = chat.Message(content=f'message {i}', username=sender.username, sender_id=sender.id,
+                               is_private=private, recipient=recipient.username if private else None)
+        db.session.add(message)
+        db.session.flush()
+        if i % 5 == 0:
+            db.session.add(chat.FileAttachment(filename=f'{i}.png', original_filename=f'{i}.png',
+                                               mime_type='image/png', file_size=1, message_id=message.id,
+                                               uploader_id=sender.id))
+    # The newest message is a DM to the viewer, so every page includes one
+    db.session.add(chat.Message(content='psst', username=users[1].username, sender_id=users[1].id,
+                                is_private=True, recipient=users[0].username))
+    viewer = {'id': users[0].id, 'username': users[0].username}
+    db.session.commit()
+    db.session.expunge_all()
+    return viewer
+
+
+def history_queries(chat, db, **kwargs):
+    # A cold profile cache is the worst case: senders are loaded too
+    chat.user_profiles.profiles.clear()
+    with count_queries(db.engine) as statements:
+        page = chat.fetch_history(**kwargs)
+    db.session.expunge_all()
+    return page, len(statements)
+
+
+@pytest.mark.parametrize('limit', [5, 50, 100])
+def test_public_page_query_count_is_bounded(chat, db, forest, limit):
+    page, queries = history_queries(chat, db, limit=limit)
+    assert len(page) == limit
+    # messages, their attachments, their senders
+    assert queries <= 3
+
+
+@pytest.mark.parametrize('limit', [5, 50, 100])
+def test_page_with_viewer_dms_query_count_is_bounded(chat, db, forest, limit):
+    page, queries = history_queries(chat, db, limit=limit, viewer=forest)
+    assert len(page) == limit
+    assert any(message['private'] for message in page)
+    # public messages and their attachments, private messages and their
+    # attachments, then all senders at once
+    assert queries <= 5
@@ -0,0 +1,51 @@
+"""Thumbnail work cleans up after itself and counts shared blobs"""
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def folders(chat, tmp_path, monkeypatch):
+    partial = tmp_path / 'partial'
+    uploads = tmp_path / 'attachments'
+    uploads.mkdir()
+    monkeypatch.setattr(chat, 'UPLOAD_PARTIAL_FOLDER', str(partial))
+    monkeypatch.setitem(chat.app.config, 'UPLOAD_FOLDER', str(uploads))
+    return partial, uploads
+
+
+def test_failed_render_leaves_no_temp_file(chat, folders, monkeypatch):
+    partial, uploads = folders
+
+    def failing_ffmpeg(command, **kwargs):
+        # ffmpeg gets part way through writing the poster frame, then fails
+        with open(command[-1], 'wb') as output:
+            output.write(b'partial')
+        raise subprocess.CalledProcessError(1, command)
+
+    monkeypatch.setattr(chat, 'FFMPEG', 'ffmpeg')
+    monkeypatch.setattr(chat.subprocess, 'run', failing_ffmpeg)
+    with pytest.raises(subprocess.CalledProcessError):
+        chat.render_thumbnail(str(uploads / 'clip.mp4'), 'video/mp4')
+    assert list(partial.iterdir()) == []
+
+
+def test_byte_identical_upload_takes_a_reference_on_the_shared_thumbnail(chat, db, folders):
+    user = chat.User(username='alice', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    thumbnail = chat.ContentBlob(sha256='b' * 64, filename='b' * 64 + '.webp', file_size=1, ref_count=1)
+    original = chat.ContentBlob(sha256='a' * 64, filename='a' * 64 + '.png', file_size=1, ref_count=2)
+    first = chat.FileAttachment(filename=original.filename, original_filename='one.png', mime_type='image/png',
+                                file_size=1, uploader_id=user.id, content_hash=original.sha256,
+                                thumbnail_filename=thumbnail.filename)
+    second = chat.FileAttachment(filename=original.filename, original_filename='two.png', mime_type='image/png',
+                                 file_size=1, uploader_id=user.id, content_hash=original.sha256)
+    db.session.add_all([thumbnail, original, first, second])
+    db.session.commit()
+
+    chat.generate_thumbnail(second.id)
+
+    db.session.expire_all()
+    assert db.session.get(chat.FileAttachment, second.id).thumbnail_filename == thumbnail.filename
+    assert db.session.get(chat.ContentBlob, thumbnail.sha256).ref_count == 2